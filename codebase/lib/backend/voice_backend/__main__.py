@@ -1,3 +1,7 @@
+import time
+
+_T0 = time.perf_counter()  # startup reference point for --startup-report
+
 import argparse
 
 from .engine import ConversaEngine, EngineConfig
@@ -10,14 +14,48 @@ def main():
     p.add_argument('--silence-ms', type=int, default=700)
     p.add_argument('--vad', type=int, default=2, choices=[0,1,2,3], help='VAD aggressiveness')
     p.add_argument('--ptt', action='store_true', help='push-to-talk mode (simplified)')
+    p.add_argument('--no-trim', action='store_true', help='send captured audio to Whisper without silence trimming')
+    p.add_argument('--continuous', action='store_true', help='keep the microphone open and capture the next turn while replying')
+    p.add_argument('--barge-in', action='store_true', help='stop the spoken reply when you start talking (headset recommended)')
+    p.add_argument('--barge-in-ms', type=int, default=240, help='speech needed to interrupt the reply')
     p.add_argument('--model', default='base')
     p.add_argument('--language', default='en')
     p.add_argument('--device', default='auto')
+    p.add_argument('--precision', default='auto', choices=['auto', 'fp32', 'fp16', 'int8', 'bf16'],
+                   help='Whisper compute precision; int8 = dynamically quantised Linear layers on CPU')
+    p.add_argument('--short-ctx-max-s', type=float, default=0.0,
+                   help='encode clips up to this many seconds with a reduced Whisper context (0 = off)')
+    p.add_argument('--cascade-from', default=None,
+                   help='transcribe with this smaller model first (e.g. tiny) and re-run doubtful results on --model')
+    p.add_argument('--cascade-budget-ms', type=float, default=1500.0, help='per-turn ASR latency budget for the cascade')
+    p.add_argument('--stream-asr', action='store_true', help='show partial transcripts while speaking')
+    p.add_argument('--speculative', action='store_true',
+                   help='request the LLM reply on the partial transcript once the user pauses (implies streaming ASR)')
+    p.add_argument('--speculative-pause-ms', type=int, default=300, help='pause that triggers the speculative request')
+    p.add_argument('--tts-backend', default='gtts', choices=['gtts', 'espeak'], help='gtts (online) or espeak (offline, in-memory PCM)')
+    p.add_argument('--tts-voice', default=None, help='backend voice name (espeak: e.g. en-us)')
     p.add_argument('--tts-lang', default='en')
     p.add_argument('--tts-slow', action='store_true')
+    p.add_argument('--tts-cache', default=None, help='directory for cached synthesised replies (enables the cache)')
+    p.add_argument('--tts-cache-mb', type=int, default=64, help='TTS cache size limit in MB')
+    p.add_argument('--tts-warmup', default=None, help='file of phrases (one per line) to pre-synthesise into the cache')
     p.add_argument('--input-wav', default=None, help='process an existing WAV file instead of recording')
+    p.add_argument('--save-reply', default=None,
+                   help='also write the spoken reply audio to this file (with --input-wav: default reply.mp3/reply.wav)')
     p.add_argument('--use-gemini', action='store_true', help='use Gemini LLM for replies')
     p.add_argument('--gemini-api-key', default=None, help='Gemini API key (overrides GEMINI_API_KEY env)')
+    p.add_argument('--startup-report', action='store_true', help='print import / model load / first-listen timings')
+    p.add_argument('--stream-reply', action='store_true', help='speak the reply sentence by sentence as it is generated')
+    p.add_argument('--stub-llm', action='store_true', help='use the offline stub responder instead of Gemini')
+    p.add_argument('--llm-deadline', type=float, default=8.0, help='seconds before falling back to local feedback')
+    p.add_argument('--context-tokens', type=int, default=1000, help='approximate LLM history budget before older turns are summarised')
+    p.add_argument('--llm-hedge-after', type=float, default=None, help='send a duplicate LLM request after this many seconds')
+    p.add_argument('--timings', action='store_true', help='print per-stage latencies after each turn')
+    p.add_argument('--metrics-file', default=None, help='write Prometheus-format stage metrics to this file after each turn')
+    p.add_argument('--metrics-port', type=int, default=None, help='serve Prometheus metrics on http://127.0.0.1:PORT/metrics')
+    p.add_argument('--profile', default=None, metavar='DIR',
+                   help='profile each turn stage (cProfile, stack samples, torch profiler for ASR) into DIR')
+    p.add_argument('--profile-sample', type=float, default=1.0, help='fraction of turns to profile with --profile')
     args = p.parse_args()
 
     cfg = EngineConfig(
@@ -26,11 +64,38 @@ def main():
         silence_ms=args.silence_ms,
         vad_aggressiveness=args.vad,
         ptt=args.ptt,
+        continuous=args.continuous,
+        barge_in=args.barge_in,
+        barge_in_ms=args.barge_in_ms,
+        trim_silence=not args.no_trim,
         model_name=args.model,
         language=args.language,
         device=args.device,
+        precision=args.precision,
+        short_ctx_max_s=args.short_ctx_max_s,
+        cascade_from=args.cascade_from,
+        cascade_budget_ms=args.cascade_budget_ms,
+        stream_asr=args.stream_asr,
+        speculative=args.speculative,
+        speculative_pause_ms=args.speculative_pause_ms,
+        stream_reply=args.stream_reply,
+        stub_llm=args.stub_llm,
+        llm_deadline_s=args.llm_deadline,
+        llm_hedge_after_s=args.llm_hedge_after,
+        context_tokens=args.context_tokens,
+        tts_backend=args.tts_backend,
+        tts_voice=args.tts_voice,
         tts_lang=args.tts_lang,
         tts_slow=args.tts_slow,
+        tts_cache_dir=args.tts_cache,
+        tts_cache_mb=args.tts_cache_mb,
+        tts_warmup_file=args.tts_warmup,
+        reply_out=None if args.input_wav else args.save_reply,
+        show_timings=args.timings,
+        metrics_file=args.metrics_file,
+        metrics_port=args.metrics_port,
+        profile_dir=args.profile,
+        profile_sample=args.profile_sample,
     )
 
     # Pass API key via env for engine path
@@ -40,36 +105,58 @@ def main():
     engine = ConversaEngine(cfg)
     if args.input_wav:
         # One-shot: bypass mic, transcribe file and speak reply
-        from .asr import WhisperASR, ASRConfig
+        from .asr import read_pcm
         from .nlp import simple_feedback
-        from .tts import GTTSVoice, TTSConfig
-        from .llm import GeminiResponder, GeminiConfig
-        asr = WhisperASR(ASRConfig(model_name=args.model, language=args.language, device=args.device))
-        text = asr.transcribe(args.input_wav)
+        from .llm import GeminiResponder, GeminiConfig, ResilienceConfig, ResilientResponder
+        from .metrics import METRICS
+        timings = {}
+        profiled = METRICS.profiler.begin_turn(timings) if METRICS.profiler else False
+        # Reuse the engine's recogniser rather than loading the model a second time
+        asr = engine.asr
+        # Decode the WAV in-process; only non-16 kHz files fall back to ffmpeg
+        pcm = read_pcm(args.input_wav)
+        with METRICS.span("asr", timings):
+            text = asr.transcribe(pcm if pcm is not None else args.input_wav)
         print(f"User (file): {text}")
         reply_text = None
         if args.use_gemini:
             key = args.gemini_api_key or __import__('os').environ.get('GEMINI_API_KEY')
             if key:
                 try:
-                    gem = GeminiResponder(GeminiConfig(api_key=key))
-                    reply_text = gem.reply([], text)
+                    gem = GeminiResponder(GeminiConfig(api_key=key, api_endpoint=__import__('os').environ.get('GEMINI_API_ENDPOINT')))
+                    with METRICS.span("llm", timings):
+                        reply_text = ResilientResponder(gem, ResilienceConfig(
+                            deadline_s=args.llm_deadline, hedge_after_s=args.llm_hedge_after)).reply([], text)
                 except Exception as e:
                     print(f"Gemini error: {e}. Falling back to local feedback.")
         if not reply_text:
             fb = simple_feedback(text)
             reply_text = fb.reply
         print(f"Assistant: {reply_text}")
-        voice = GTTSVoice(TTSConfig(lang=args.tts_lang, slow=args.tts_slow))
-        out_mp3 = "reply.mp3"
-        voice.synthesize_to_file(reply_text, out_mp3)
-        print(f"Spoken reply saved to {out_mp3}")
+        voice = engine.voice
+        out_path = args.save_reply or f"reply.{voice.format}"
+        with open(out_path, "wb") as f, METRICS.span("tts", timings):
+            voice.synthesize_to_fp(reply_text, f)
+        print(f"Spoken reply saved to {out_path}")
+        if args.timings:
+            print("(timings: " + ", ".join(f"{k} {v:.0f}" for k, v in timings.items()) + ")")
+        if args.metrics_file:
+            METRICS.dump(args.metrics_file)
+        if profiled:
+            print(f"Profile written to {METRICS.profiler.end_turn(timings)}")
     else:
         print("ConversaAI started. Speak after the prompt.")
-        while True:
-            cont = engine.run_once()
-            if not cont:
-                break
+        first = True
+        try:
+            while True:
+                cont = engine.run_once()
+                if first and args.startup_report:
+                    print(f"Startup: {engine.startup_report(_T0)}")
+                first = False
+                if not cont:
+                    break
+        finally:
+            engine.close()
 
 
 if __name__ == '__main__':
@@ -1,9 +1,193 @@
+import contextlib
+import gc
+import sys
+import threading
+import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-import whisper
-import torch
+
+# torch/whisper are imported where used: they take seconds to import and
+# entry points such as list_devices or text-only daemon turns never need them.
+
+
+SAMPLE_RATE = 16000  # Whisper expects 16 kHz mono
+
+# A WAV/MP3 path (decoded by ffmpeg) or 16 kHz mono PCM already in memory
+AudioInput = Union[str, np.ndarray]
+
+
+def pcm_to_float32(pcm: np.ndarray) -> np.ndarray:
+    """Convert int16 or float PCM to the contiguous float32 [-1, 1] array Whisper takes."""
+    if pcm.ndim > 1:
+        pcm = pcm.mean(axis=1)
+    if pcm.dtype == np.int16:
+        return np.ascontiguousarray(pcm, dtype=np.float32) / 32768.0
+    return np.ascontiguousarray(pcm, dtype=np.float32)
+
+
+def read_pcm(path: str) -> Optional[np.ndarray]:
+    """Read a 16 kHz WAV into float32 without spawning ffmpeg.
+    Returns None when the file needs resampling/decoding by ffmpeg instead.
+    """
+    try:
+        import soundfile as sf
+        data, sr = sf.read(path, dtype='float32', always_2d=False)
+    except Exception:
+        return None
+    if sr != SAMPLE_RATE:
+        return None
+    return pcm_to_float32(data)
+
+
+def load_float32(audio: AudioInput) -> np.ndarray:
+    """Resolve a path or PCM array to float32 16 kHz mono, preferring in-process WAV decode."""
+    if isinstance(audio, np.ndarray):
+        return pcm_to_float32(audio)
+    pcm = read_pcm(audio)
+    if pcm is not None:
+        return pcm
+    import whisper
+    return whisper.load_audio(audio)  # ffmpeg decode/resample
+
+
+ModelKey = Tuple[str, str, str]  # (model_name, device, precision)
+
+PRECISIONS = ("auto", "fp32", "fp16", "int8", "bf16")
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantisation of every Linear layer (CPU only).
+
+    Whisper subclasses nn.Linear only to cast weights to the input dtype, which
+    is a no-op for fp32 CPU inference, but torch's quantiser matches exact
+    types, so the subclasses are demoted to plain nn.Linear first.
+    """
+    import torch
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _bf16_supported(device: str) -> bool:
+    import torch
+    if device == "cuda":
+        return torch.cuda.is_bf16_supported()
+    probe = getattr(getattr(torch, "cpu", None), "_is_avx512_bf16_supported", None)
+    if probe is not None:
+        try:
+            return bool(probe())
+        except Exception:
+            return False
+    return torch.backends.mkldnn.is_available()
+
+
+def resolve_precision(want: str, device: str) -> Tuple[str, str]:
+    """Map a requested precision onto what the device can run; returns (device, precision)."""
+    want = (want or "auto").lower()
+    if want not in PRECISIONS:
+        raise ValueError(f"unknown precision '{want}' (choose from {', '.join(PRECISIONS)})")
+    if want == "auto":
+        return device, ("fp16" if device == "cuda" else "fp32")
+    if want == "fp16" and device != "cuda":
+        print("[asr] fp16 needs CUDA; using fp32 on CPU.", file=sys.stderr)
+        return device, "fp32"
+    if want == "int8" and device != "cpu":
+        print("[asr] int8 quantisation is CPU-only; running on CPU.", file=sys.stderr)
+        return "cpu", "int8"
+    if want == "bf16" and not _bf16_supported(device):
+        print("[asr] bf16 not supported on this device; using fp32.", file=sys.stderr)
+        return device, "fp32"
+    return device, want
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded Whisper models.
+
+    Every WhisperASR asks the registry instead of calling whisper.load_model,
+    so the CLI, the engines and the daemon share one copy per
+    (model_name, device, precision). Loads are serialised per key, so two
+    threads asking for the same model at once still load it only once.
+    """
+
+    def __init__(self, loader: Optional[Callable[[str, str, str], object]] = None):
+        self._loader = loader or self._load_whisper
+        self._models: Dict[ModelKey, object] = {}
+        self._key_locks: Dict[ModelKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_whisper(name: str, device: str, precision: str):
+        import whisper
+        model = whisper.load_model(name, device=device)
+        if precision == "int8":
+            model = quantize_int8(model)
+        elif precision == "bf16":
+            # DecodingTask rejects audio features that are neither fp16 nor fp32,
+            # so the encoder hands float32 back out of the bf16 autocast region
+            model.encoder.register_forward_hook(lambda module, args, out: out.float())
+        return model
+
+    def get(self, name: str, device: str, precision: str = "fp32"):
+        key = (name, device, precision)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                return model
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                model = self._models.get(key)
+            if model is None:
+                model = self._loader(name, device, precision)
+                with self._lock:
+                    self._models[key] = model
+        return model
+
+    def loaded(self) -> List[ModelKey]:
+        with self._lock:
+            return list(self._models)
+
+    def unload(self, name: Optional[str] = None, device: Optional[str] = None,
+               precision: Optional[str] = None) -> int:
+        """Drop matching models (all when no filter is given); returns how many were dropped.
+        Consumers still holding a reference keep the model alive until they let go.
+        """
+        with self._lock:
+            keys = [
+                k for k in self._models
+                if (name is None or k[0] == name)
+                and (device is None or k[1] == device)
+                and (precision is None or k[2] == precision)
+            ]
+            for k in keys:
+                del self._models[k]
+        if keys:
+            gc.collect()
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        return len(keys)
+
+    def memory_report(self) -> Dict[str, int]:
+        """Bytes held by the weights of each loaded model, keyed 'name/device/precision'."""
+        report: Dict[str, int] = {}
+        with self._lock:
+            items = list(self._models.items())
+        for key, model in items:
+            total = 0
+            # state_dict also covers the packed weights of int8-quantised layers
+            for value in model.state_dict().values():
+                for t in (value if isinstance(value, (tuple, list)) else (value,)):
+                    if hasattr(t, "numel") and hasattr(t, "element_size"):
+                        total += t.numel() * t.element_size()
+            report["/".join(key)] = total
+        return report
+
+
+MODELS = ModelRegistry()
 
 
 @dataclass
@@ -11,39 +195,307 @@ class ASRConfig:
     model_name: str = "base"  # tiny|base|small|medium|large-v2
     language: Optional[str] = "en"
     device: str = "auto"  # 'auto' | 'cpu' | 'cuda' | 'gpu'
+    precision: str = "auto"  # 'auto' (fp16 on CUDA, fp32 on CPU) | 'fp32' | 'fp16' | 'int8' | 'bf16'
+    short_ctx_max_s: float = 0.0  # clips up to this long use a reduced encoder context; 0 disables
+
+
+# Fast-path results worse than these fall back to the full 30 s window
+# (same thresholds Whisper uses to trigger temperature fallback)
+SHORT_MIN_AVG_LOGPROB = -1.0
+SHORT_MAX_COMPRESSION = 2.4
+SHORT_PAD_S = 1.0  # silence appended after the clip inside the reduced window
 
 
 class WhisperASR:
-    def __init__(self, cfg: ASRConfig):
+    def __init__(self, cfg: ASRConfig, background: bool = False):
+        """Load the model now, or on a daemon thread when background=True.
+        With background loading, the first use of .model blocks until it is ready,
+        so callers can open the microphone while torch/whisper import and load.
+        """
         self.cfg = cfg
-        # Resolve device
-        want = (cfg.device or "auto").lower()
-        if want in ("cuda", "gpu") and torch.cuda.is_available():
-            device = "cuda"
-        elif want == "auto":
-            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device: Optional[str] = None
+        self.precision: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.ready_at: Optional[float] = None  # time.perf_counter() when the model became usable
+        self._model = None
+        self._load_error: Optional[BaseException] = None
+        self._ready = threading.Event()
+        if background:
+            threading.Thread(target=self._load, daemon=True).start()
         else:
-            device = "cpu"
-
-        # Enable GPU-friendly settings
-        if device == "cuda":
-            torch.backends.cuda.matmul.allow_tf32 = True  # TensorFloat32 for speed
-            torch.backends.cudnn.allow_tf32 = True
-            torch.backends.cudnn.benchmark = True
-            try:
-                torch.set_float32_matmul_precision("high")
-            except Exception:
-                pass
-
-        self.device = device
-        self.model = whisper.load_model(cfg.model_name, device=device)
-
-    def transcribe(self, wav_path: str) -> str:
-        # Use fp16 on CUDA for speed
-        use_fp16 = (self.device == "cuda")
-        result = self.model.transcribe(
-            wav_path,
+            self._load()
+            if self._load_error is not None:
+                raise self._load_error
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            import torch
+            # Resolve device
+            want = (self.cfg.device or "auto").lower()
+            if want in ("cuda", "gpu") and torch.cuda.is_available():
+                device = "cuda"
+            elif want == "auto":
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+            else:
+                device = "cpu"
+
+            # Enable GPU-friendly settings
+            if device == "cuda":
+                torch.backends.cuda.matmul.allow_tf32 = True  # TensorFloat32 for speed
+                torch.backends.cudnn.allow_tf32 = True
+                torch.backends.cudnn.benchmark = True
+                try:
+                    torch.set_float32_matmul_precision("high")
+                except Exception:
+                    pass
+
+            device, precision = resolve_precision(self.cfg.precision, device)
+            self.device = device
+            self.precision = precision
+            self._model = MODELS.get(self.cfg.model_name, device, self.precision)
+            if device == "cuda":
+                torch.cuda.synchronize()
+        except BaseException as e:
+            self._load_error = e
+        finally:
+            self.ready_at = time.perf_counter()
+            self.load_seconds = self.ready_at - t0
+            self._ready.set()
+
+    @property
+    def model(self):
+        self._ready.wait()
+        if self._load_error is not None:
+            raise RuntimeError(f"Whisper model failed to load: {self._load_error}") from self._load_error
+        return self._model
+
+    def _autocast(self):
+        """bf16 runs the fp32 weights under autocast; other precisions need no context."""
+        if self.precision != "bf16":
+            return contextlib.nullcontext()
+        import torch
+        return torch.autocast(device_type=self.device, dtype=torch.bfloat16)
+
+    def transcribe_result(self, audio: AudioInput, **kwargs) -> dict:
+        """Run Whisper and return its full result dict (text, segments, language)."""
+        model = self.model
+        if isinstance(audio, np.ndarray):
+            audio = pcm_to_float32(audio)
+        with self._autocast():
+            return model.transcribe(
+                audio,
+                language=self.cfg.language,
+                fp16=(self.precision == "fp16"),
+                **kwargs,
+            )
+
+    def encode_short(self, pcm: np.ndarray):
+        """Run the encoder on a context sized to the clip instead of the padded 30 s.
+
+        Whisper's AudioEncoder.forward insists on the full 1500-position input, so
+        its layers are applied here directly with a truncated positional embedding.
+        Encoder cost is roughly linear in context length (attention quadratic).
+        """
+        import torch
+        import torch.nn.functional as F
+        import whisper
+        model = self.model
+        enc = model.encoder
+        n_mels = getattr(model.dims, "n_mels", 80)
+        audio = torch.from_numpy(pcm_to_float32(pcm))
+        mel = whisper.log_mel_spectrogram(audio, n_mels=n_mels, padding=whisper.audio.N_SAMPLES)
+        frames = int((pcm.size / SAMPLE_RATE + SHORT_PAD_S) * whisper.audio.FRAMES_PER_SECOND)
+        frames = min(whisper.audio.N_FRAMES, frames + frames % 2)  # conv2 has stride 2
+        mel = mel[:, :frames].unsqueeze(0).to(self.device)
+        dtype = torch.float16 if self.precision == "fp16" else torch.float32
+        with torch.no_grad(), self._autocast():
+            x = F.gelu(enc.conv1(mel.to(dtype)))
+            x = F.gelu(enc.conv2(x))
+            x = x.permute(0, 2, 1)
+            x = (x + enc.positional_embedding[:x.shape[1]]).to(x.dtype)
+            for block in enc.blocks:
+                x = block(x)
+            return enc.ln_post(x).to(dtype)
+
+    def transcribe_short(self, pcm: np.ndarray) -> Optional[str]:
+        """Reduced-context greedy decode; returns None when the result looks unreliable."""
+        if not self.cfg.language:
+            # language detection would re-run the encoder on the already reduced features
+            return None
+        import torch
+        from whisper.decoding import DecodingOptions, DecodingTask
+
+        class _EncodedTask(DecodingTask):
+            # features are already encoded at the reduced context
+            def _get_audio_features(self, mel):
+                return mel
+
+        features = self.encode_short(pcm)
+        options = DecodingOptions(
             language=self.cfg.language,
-            fp16=use_fp16,
+            fp16=(self.precision == "fp16"),
+            without_timestamps=True,
         )
+        with torch.no_grad(), self._autocast():
+            res = _EncodedTask(self.model, options).run(features)[0]
+        text = res.text.strip()
+        if (not text or res.avg_logprob < SHORT_MIN_AVG_LOGPROB
+                or res.compression_ratio > SHORT_MAX_COMPRESSION):
+            return None
+        return text
+
+    def transcribe(self, audio: AudioInput) -> str:
+        """Transcribe a file path or in-memory int16/float32 16 kHz mono PCM."""
+        if (self.cfg.short_ctx_max_s > 0 and isinstance(audio, np.ndarray)
+                and 0 < audio.size <= self.cfg.short_ctx_max_s * SAMPLE_RATE):
+            text = self.transcribe_short(audio)
+            if text is not None:
+                return text
+        result = self.transcribe_result(audio)
         return result.get("text", "").strip()
+
+    def transcribe_batch(self, inputs: Sequence[AudioInput], batch_size: int = 8) -> List[str]:
+        """Transcribe many clips, running the encoder and greedy decoding over padded batches.
+
+        Clips up to 30 s share one mel batch per `batch_size` items; longer clips
+        need Whisper's sliding-window loop and go through transcribe() one by one.
+        Texts are returned in input order.
+        """
+        return [r.get("text", "").strip() for r in self.transcribe_batch_results(inputs, batch_size)]
+
+    def transcribe_batch_results(self, inputs: Sequence[AudioInput], batch_size: int = 8) -> List[dict]:
+        """Like transcribe_batch(), but Whisper-style result dicts (one segment per
+        batched clip) so result_confidence() works on them."""
+        import torch
+        import whisper
+        model = self.model
+        results: List[dict] = [{"text": "", "segments": []} for _ in inputs]
+        short: List[tuple] = []
+        for i, audio in enumerate(inputs):
+            pcm = load_float32(audio)
+            if pcm.size > whisper.audio.N_SAMPLES:
+                results[i] = self.transcribe_result(pcm)
+            elif pcm.size:
+                short.append((i, pcm))
+
+        n_mels = getattr(model.dims, "n_mels", 80)
+        options = whisper.DecodingOptions(
+            language=self.cfg.language,
+            fp16=(self.precision == "fp16"),
+            without_timestamps=True,
+        )
+        for start in range(0, len(short), batch_size):
+            group = short[start:start + batch_size]
+            mel = torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(pcm)), n_mels=n_mels)
+                for _, pcm in group
+            ]).to(self.device)
+            with torch.no_grad(), self._autocast():
+                decoded = whisper.decode(model, mel, options)
+            for (i, pcm), res in zip(group, decoded):
+                results[i] = {"text": res.text.strip(), "segments": [{
+                    "start": 0.0,
+                    "end": pcm.size / SAMPLE_RATE,
+                    "avg_logprob": res.avg_logprob,
+                    "no_speech_prob": res.no_speech_prob,
+                    "compression_ratio": res.compression_ratio,
+                }]}
+        return results
+
+
+@dataclass
+class CascadeConfig:
+    budget_ms: float = 1500.0          # per-turn ASR latency budget
+    min_avg_logprob: float = -0.7      # below this the fast result is doubted
+    max_no_speech_prob: float = 0.5
+    max_compression_ratio: float = 2.2
+
+
+def result_confidence(result: dict) -> Tuple[float, float, float]:
+    """(duration-weighted avg_logprob, max no_speech_prob, max compression_ratio) of a Whisper result."""
+    segs = result.get("segments") or []
+    if not segs:
+        return 0.0, 1.0, 0.0
+    weights = np.array([max(s["end"] - s["start"], 1e-3) for s in segs])
+    logprob = float(np.average([s["avg_logprob"] for s in segs], weights=weights))
+    return (
+        logprob,
+        float(max(s["no_speech_prob"] for s in segs)),
+        float(max(s["compression_ratio"] for s in segs)),
+    )
+
+
+class CascadeASR:
+    """Transcribe with a small model first and escalate only doubtful results.
+
+    The fast model's segment statistics decide confidence. A low-confidence
+    result is re-run on the accurate model only if the time already spent plus
+    the accurate model's expected cost (tracked as an EMA of seconds per audio
+    second) still fits the turn's latency budget; otherwise the fast text stands.
+    Attributes not defined here (device, ready_at, ...) come from the accurate model.
+    """
+
+    def __init__(self, fast: WhisperASR, accurate: WhisperASR, cfg: Optional[CascadeConfig] = None):
+        self.fast = fast
+        self.accurate = accurate
+        self.ccfg = cfg or CascadeConfig()
+        self._rtf: Optional[float] = None  # accurate model seconds per audio second
+        self.stats = {"fast": 0, "escalated": 0, "over_budget": 0}
+
+    def __getattr__(self, name):
+        return getattr(self.accurate, name)
+
+    def confident(self, result: dict) -> bool:
+        logprob, no_speech, compression = result_confidence(result)
+        if not result.get("text", "").strip():
+            return no_speech > self.ccfg.max_no_speech_prob  # silence is a confident empty result
+        return (logprob >= self.ccfg.min_avg_logprob
+                and no_speech <= self.ccfg.max_no_speech_prob
+                and compression <= self.ccfg.max_compression_ratio)
+
+    def transcribe_result(self, audio: AudioInput, **kwargs) -> dict:
+        t0 = time.perf_counter()
+        pcm = load_float32(audio)
+        result = self.fast.transcribe_result(pcm, **kwargs)
+        if self.confident(result):
+            self.stats["fast"] += 1
+            return result
+        spent = time.perf_counter() - t0
+        audio_s = pcm.size / SAMPLE_RATE
+        if self._rtf is not None and spent + self._rtf * audio_s > self.ccfg.budget_ms / 1000.0:
+            self.stats["over_budget"] += 1
+            return result
+        t1 = time.perf_counter()
+        better = self.accurate.transcribe_result(pcm, **kwargs)
+        rtf = (time.perf_counter() - t1) / max(audio_s, 0.1)
+        self._rtf = rtf if self._rtf is None else 0.8 * self._rtf + 0.2 * rtf
+        self.stats["escalated"] += 1
+        return better
+
+    def transcribe(self, audio: AudioInput) -> str:
+        return self.transcribe_result(audio).get("text", "").strip()
+
+    def transcribe_batch(self, inputs: Sequence[AudioInput], batch_size: int = 8) -> List[str]:
+        """Batched cascade: the fast model decodes every clip, then the doubtful
+        ones go through the accurate model together if that still fits the budget."""
+        t0 = time.perf_counter()
+        pcms = [load_float32(audio) for audio in inputs]
+        results = self.fast.transcribe_batch_results(pcms, batch_size)
+        doubtful = [i for i, r in enumerate(results) if not self.confident(r)]
+        self.stats["fast"] += len(results) - len(doubtful)
+        if doubtful:
+            spent = time.perf_counter() - t0
+            # a batch takes about as long as its longest clip
+            audio_s = max(pcms[i].size for i in doubtful) / SAMPLE_RATE
+            if self._rtf is not None and spent + self._rtf * audio_s > self.ccfg.budget_ms / 1000.0:
+                self.stats["over_budget"] += len(doubtful)
+            else:
+                t1 = time.perf_counter()
+                better = self.accurate.transcribe_batch_results([pcms[i] for i in doubtful], batch_size)
+                rtf = (time.perf_counter() - t1) / max(audio_s, 0.1)
+                self._rtf = rtf if self._rtf is None else 0.8 * self._rtf + 0.2 * rtf
+                self.stats["escalated"] += len(doubtful)
+                for i, res in zip(doubtful, better):
+                    results[i] = res
+        return [r.get("text", "").strip() for r in results]
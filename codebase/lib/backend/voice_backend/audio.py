@@ -1,9 +1,12 @@
 import io
 import queue
+import subprocess
 import sys
+import threading
 import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from typing import Callable, Optional, List, Tuple
 
 import numpy as np
 try:
@@ -13,6 +16,7 @@ except Exception:
 import soundfile as sf
 import webrtcvad
 
+from .endpoint import ACTIVE, END, ONSET, EndpointConfig, Endpointer
 
 SAMPLE_RATE = 16000  # 16 kHz mono for Whisper + VAD
 SAMPLE_WIDTH = 2     # 16-bit PCM
@@ -23,6 +27,79 @@ def _rms(x: np.ndarray) -> float:
     return float(np.sqrt(np.mean(np.square(x.astype(np.float32) / 32768.0)) + 1e-9))
 
 
+def frame_rms(x: np.ndarray, frame_len: int) -> np.ndarray:
+    """Per-frame RMS (same scale as _rms) for every whole frame, computed in one pass."""
+    n = x.size // frame_len
+    frames = x[:n * frame_len].reshape(n, frame_len).astype(np.float32) / 32768.0
+    return np.sqrt(np.mean(frames * frames, axis=1) + 1e-9)
+
+
+@dataclass
+class TrimStats:
+    input_ms: int
+    output_ms: int
+    leading_ms: int = 0
+    trailing_ms: int = 0
+    pauses_ms: int = 0
+
+    @property
+    def removed_ms(self) -> int:
+        return self.input_ms - self.output_ms
+
+
+def trim_silence(pcm16: np.ndarray, frame_ms: int = 30, voiced: Optional[np.ndarray] = None,
+                 rms_floor: float = 0.01, pad_ms: int = 150,
+                 max_pause_ms: int = 500) -> Tuple[np.ndarray, TrimStats]:
+    """Cut leading/trailing silence and shorten long internal pauses.
+
+    A frame counts as active when the VAD marked it voiced (if `voiced` flags
+    are given) or its RMS exceeds rms_floor. pad_ms of context is kept around
+    the speech, and any inactive run longer than max_pause_ms is collapsed to
+    max_pause_ms (kept half on each side of the cut).
+    """
+    frame_len = int(SAMPLE_RATE * frame_ms / 1000)
+    total_ms = int(pcm16.size * 1000 / SAMPLE_RATE)
+    n = pcm16.size // frame_len
+    if n == 0:
+        return pcm16, TrimStats(total_ms, total_ms)
+    active = frame_rms(pcm16, frame_len) > rms_floor
+    if voiced is not None and voiced.size:
+        m = min(n, voiced.size)
+        active[:m] |= voiced[:m].astype(bool)
+    idx = np.flatnonzero(active)
+    if idx.size == 0:
+        return pcm16[:0], TrimStats(total_ms, 0, leading_ms=total_ms)
+
+    pad = pad_ms // frame_ms
+    first = max(0, idx[0] - pad)
+    last = min(n, idx[-1] + 1 + pad)
+    keep = np.zeros(n, dtype=bool)
+    keep[first:last] = True
+
+    # Collapse long pauses between the first and last active frame
+    max_pause = max(1, max_pause_ms // frame_ms)
+    gaps = np.diff(idx) - 1
+    pauses_frames = 0
+    for g_start, g_len in zip(idx[:-1] + 1, gaps):
+        if g_len > max_pause:
+            head = max_pause // 2
+            keep[g_start + head:g_start + g_len - (max_pause - head)] = False
+            pauses_frames += g_len - max_pause
+
+    frames = pcm16[:n * frame_len].reshape(n, frame_len)
+    out = frames[keep].reshape(-1)
+    if last == n:
+        out = np.concatenate([out, pcm16[n * frame_len:]])  # keep the partial tail frame
+    stats = TrimStats(
+        input_ms=total_ms,
+        output_ms=int(out.size * 1000 / SAMPLE_RATE),
+        leading_ms=int(first * frame_ms),
+        trailing_ms=int((n - last) * frame_ms),
+        pauses_ms=int(pauses_frames * frame_ms),
+    )
+    return out, stats
+
+
 @dataclass
 class AudioConfig:
     device_index: Optional[int] = None
@@ -30,6 +107,12 @@ class AudioConfig:
     silence_ms: int = 600       # end record after this much silence
     vad_aggressiveness: int = 2 # 0-3
     ptt: bool = False           # push-to-talk mode
+    preroll_ms: int = 1000      # audio kept from before speech onset
+    hangover_ms: Optional[int] = None  # trailing silence kept; None = all of silence_ms
+    max_utterance_s: float = 60.0
+    energy_gate_dbfs: float = -55.0    # quieter frames skip the VAD call
+    trim_silence: bool = True   # cut leading/trailing silence and long pauses before ASR
+    max_pause_ms: int = 500     # internal pauses longer than this are shortened to it
 
 
 class MicRecorder:
@@ -40,16 +123,33 @@ class MicRecorder:
         self.block_size = int(SAMPLE_RATE * cfg.chunk_ms / 1000)
         self.stream = None
         self.vad = webrtcvad.Vad(cfg.vad_aggressiveness)
+        self.endpointer = Endpointer(EndpointConfig(
+            frame_ms=cfg.chunk_ms,
+            silence_ms=cfg.silence_ms,
+            preroll_ms=cfg.preroll_ms,
+            hangover_ms=cfg.hangover_ms,
+            max_utterance_s=cfg.max_utterance_s,
+            energy_gate_dbfs=cfg.energy_gate_dbfs,
+        ), self.vad, SAMPLE_RATE)
         self.q = queue.Queue()
+        self.last_trim: Optional[TrimStats] = None
+        self.last_endpoint_ms = 0
+        self.muted = False  # drop incoming frames, e.g. while our own reply is playing
+        self.tap: Optional[Callable[[np.ndarray], None]] = None  # sees frames even while muted
 
     def _callback(self, indata, frames, time_, status):
         if status:
             print(f"[audio] {status}", file=sys.stderr)
-        mono = indata[:, 0]
-        pcm16 = (np.clip(mono, -1.0, 1.0) * 32767).astype(np.int16)
-        self.q.put(pcm16)
+        if self.tap is not None:
+            self.tap(indata[:, 0].copy())
+        if self.muted:
+            return
+        # Stream delivers int16 already; one copy of the mono column is all the work here
+        self.q.put(indata[:, 0].copy())
 
     def __enter__(self):
+        if self.stream is not None:
+            return self  # already open, e.g. a barge-in monitor handed over to the next turn
         if sd is None:
             raise RuntimeError(
                 "sounddevice/PortAudio not available. Install system package 'portaudio' (e.g., 'sudo apt-get install portaudio19-dev') and reinstall the Python package 'sounddevice'."
@@ -57,7 +157,7 @@ class MicRecorder:
         self.stream = sd.InputStream(
             samplerate=SAMPLE_RATE,
             channels=CHANNELS,
-            dtype='float32',
+            dtype='int16',
             blocksize=self.block_size,
             callback=self._callback,
             device=self.cfg.device_index,
@@ -74,18 +174,22 @@ class MicRecorder:
                 pass
         self.stream = None
 
-    def record_once(self) -> np.ndarray:
+    def stop(self):
+        """Wake a blocked record_once so it returns what it has captured so far."""
+        self.q.put(None)
+
+    def record_once(self, on_frame: Optional[Callable[[np.ndarray], None]] = None,
+                    announce: bool = True) -> np.ndarray:
         """Record a single utterance using VAD or push-to-talk.
         Returns int16 mono PCM at 16kHz.
+        on_frame, if given, receives every kept frame from speech onset on
+        (including the pre-roll buffer), e.g. to feed a streaming transcriber.
         """
-        frames: List[np.ndarray] = []
-        voiced = False
-        silence_start: Optional[float] = None
-
-        chunk_dur = self.cfg.chunk_ms / 1000.0
-        silence_thresh = self.cfg.silence_ms / 1000.0
+        ep = self.endpointer
+        ep.reset()
 
-        print("Listening… (Ctrl+C to quit)")
+        if announce:
+            print("Listening… (Ctrl+C to quit)")
         try:
             if self.cfg.ptt:
                 print("Push-to-talk: hold SPACE to record, release to stop.")
@@ -93,38 +197,99 @@ class MicRecorder:
                 # Capture until a brief silence window after initial speech.
             while True:
                 pcm16 = self.q.get()
-                is_speech = self.vad.is_speech(pcm16.tobytes(), SAMPLE_RATE)
-                if is_speech:
-                    frames.append(pcm16)
-                    voiced = True
-                    silence_start = None
-                else:
-                    if voiced:
-                        frames.append(pcm16)
-                        if silence_start is None:
-                            silence_start = time.time()
-                        elif time.time() - silence_start >= silence_thresh:
-                            break
-                    else:
-                        # Wait for speech to start, but keep small buffer
-                        frames.append(pcm16)
-                        # Trim buffer to 1s max
-                        max_buf = int(1.0 / chunk_dur)
-                        if len(frames) > max_buf:
-                            frames = frames[-max_buf:]
+                if pcm16 is None:
+                    break
+                state = ep.push(pcm16)
+                if on_frame is not None:
+                    if state == ONSET:
+                        on_frame(ep.audio())
+                    elif state in (ACTIVE, END):
+                        on_frame(pcm16)
+                if state == END:
+                    break
         except KeyboardInterrupt:
             pass
 
-        if not frames:
+        # Silence the endpointer waited out before declaring the end of the turn
+        self.last_endpoint_ms = ep.trailing_silence_ms if ep.done else 0
+        if not ep.in_speech:
             return np.zeros((0,), dtype=np.int16)
-        audio = np.concatenate(frames)
-        # Trim leading/trailing low RMS segments lightly (no-op for now)
-        rms = _rms(audio)
-        if rms < 1e-3:
-            return audio
+        audio = ep.audio()
+        if self.cfg.trim_silence:
+            audio, self.last_trim = trim_silence(
+                audio,
+                frame_ms=self.cfg.chunk_ms,
+                voiced=ep.voiced_flags(),
+                max_pause_ms=self.cfg.max_pause_ms,
+            )
         return audio
 
 
+class ContinuousCapture:
+    """Keep one input stream open for the whole session.
+
+    A segmenter thread runs MicRecorder.record_once back to back and queues each
+    completed utterance, so speech that starts while the previous turn is still
+    being transcribed/answered is captured instead of lost, and the device is
+    opened only once.
+    """
+
+    def __init__(self, cfg: AudioConfig, max_pending: int = 8):
+        self.mic = MicRecorder(cfg)
+        self.utterances: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.mic.__enter__()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            pcm16 = self.mic.record_once(announce=False)
+            if self._stop.is_set():
+                break
+            if pcm16.size == 0:
+                continue
+            if self.utterances.full():
+                # Consumer is far behind; keep the newest speech
+                try:
+                    self.utterances.get_nowait()
+                except queue.Empty:
+                    pass
+            self.utterances.put(pcm16)
+
+    @property
+    def muted(self) -> bool:
+        return self.mic.muted
+
+    @muted.setter
+    def muted(self, value: bool):
+        self.mic.muted = value
+
+    def get(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """Next completed utterance, or None on timeout."""
+        try:
+            return self.utterances.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._stop.set()
+        self.mic.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self.mic.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
 def write_wav(path: str, pcm16: np.ndarray, samplerate: int = SAMPLE_RATE):
     sf.write(path, pcm16.astype(np.int16), samplerate, subtype='PCM_16')
 
@@ -135,6 +300,110 @@ def pcm16_to_wav_bytes(pcm16: np.ndarray, samplerate: int = SAMPLE_RATE) -> byte
         return buf.getvalue()
 
 
+class BargeInDetector:
+    """Detect the user talking over playback.
+
+    Fed microphone frames (via MicRecorder.tap) while a reply plays; sets
+    `triggered` after min_speech_ms of consecutive loud, VAD-voiced frames. The
+    energy floor is deliberately higher than the endpointer's so speaker echo
+    does not count. The last preroll_ms of frames are kept so the interrupting
+    speech can be handed to the recorder (on_trigger) instead of being lost.
+    """
+
+    def __init__(self, vad_aggressiveness: int = 2, frame_ms: int = 30, min_speech_ms: int = 240,
+                 energy_dbfs: float = -40.0, preroll_ms: int = 600,
+                 triggered: Optional[threading.Event] = None,
+                 on_trigger: Optional[Callable[[List[np.ndarray]], None]] = None):
+        self.vad = webrtcvad.Vad(vad_aggressiveness)
+        self.frame_len = int(SAMPLE_RATE * frame_ms / 1000)
+        self.min_frames = max(1, min_speech_ms // frame_ms)
+        amp = (10.0 ** (energy_dbfs / 20.0)) * 32768.0
+        self._energy_gate = amp * amp * self.frame_len
+        self._recent: "deque[np.ndarray]" = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self._run = 0
+        self.on_trigger = on_trigger
+        self.triggered = triggered or threading.Event()
+
+    def __call__(self, frame: np.ndarray):
+        if self.triggered.is_set():
+            return
+        self._recent.append(frame)
+        f = frame.astype(np.float32)
+        loud = frame.size == self.frame_len and float(np.dot(f, f)) >= self._energy_gate
+        if loud and self.vad.is_speech(frame.tobytes(), SAMPLE_RATE):
+            self._run += 1
+        else:
+            self._run = 0
+        if self._run >= self.min_frames:
+            self.triggered.set()
+            if self.on_trigger is not None:
+                self.on_trigger(list(self._recent))
+
+
+def decode_audio(data: bytes, samplerate: int = 24000) -> Tuple[np.ndarray, int]:
+    """Decode an encoded clip (e.g. gTTS MP3) to mono int16 PCM in memory.
+    Uses libsndfile when it can read the format (MP3 needs libsndfile >= 1.1),
+    otherwise pipes through ffmpeg, resampling to `samplerate`.
+    """
+    try:
+        pcm, sr = sf.read(io.BytesIO(data), dtype='int16', always_2d=False)
+        if pcm.ndim > 1:
+            pcm = pcm.mean(axis=1).astype(np.int16)
+        return pcm, sr
+    except Exception:
+        pass
+    proc = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1",
+         "-ar", str(samplerate), "pipe:1"],
+        input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg decode failed: {proc.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.int16), samplerate
+
+
+def play_file(path: str) -> bool:
+    """Play an audio file with ffplay (FFmpeg), blocking until done.
+    Returns False when ffplay is not installed.
+    """
+    import subprocess
+    try:
+        subprocess.run([
+            "ffplay", "-nodisp", "-autoexit", "-loglevel", "error", path
+        ], check=False)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def can_play_pcm() -> bool:
+    return sd is not None
+
+
+def play_pcm(pcm: np.ndarray, samplerate: int, interrupt: Optional[threading.Event] = None) -> bool:
+    """Play an in-memory PCM buffer on the default output device, blocking until done.
+    Returns False if `interrupt` was set first, in which case playback stops at once.
+    """
+    if sd is None:
+        raise RuntimeError("sounddevice/PortAudio not available for playback.")
+    if interrupt is not None and interrupt.is_set():
+        return False
+    sd.play(pcm, samplerate)
+    if interrupt is None:
+        sd.wait()
+        return True
+    deadline = time.monotonic() + len(pcm) / samplerate + 0.5
+    while time.monotonic() < deadline:
+        if interrupt.wait(0.02):
+            sd.stop()
+            return False
+        stream = sd.get_stream()
+        if stream is None or not stream.active:
+            break
+    sd.wait()
+    return True
+
+
 def list_input_devices() -> List[Tuple[int, str]]:
     if sd is None:
         return []
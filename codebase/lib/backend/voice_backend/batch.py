@@ -0,0 +1,53 @@
+"""Offline batch transcription, e.g. for scoring a folder of IELTS recordings.
+Prints one JSON line {"file": str, "transcript": str} per clip.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from .asr import ASRConfig, WhisperASR
+
+AUDIO_EXTS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".webm")
+
+
+def main():
+    p = argparse.ArgumentParser(description="ConversaAI batch transcription")
+    p.add_argument('paths', nargs='+', help='audio files or directories')
+    p.add_argument('--model', default='base')
+    p.add_argument('--language', default='en')
+    p.add_argument('--device', default='auto')
+    p.add_argument('--precision', default='auto', choices=['auto', 'fp32', 'fp16', 'int8', 'bf16'])
+    p.add_argument('--batch-size', type=int, default=8)
+    args = p.parse_args()
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(AUDIO_EXTS)
+            )
+        else:
+            files.append(path)
+    if not files:
+        print("No audio files found.", file=sys.stderr)
+        sys.exit(2)
+
+    asr = WhisperASR(ASRConfig(
+        model_name=args.model,
+        language=args.language,
+        device=args.device,
+        precision=args.precision,
+    ))
+    t0 = time.perf_counter()
+    texts = asr.transcribe_batch(files, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - t0
+    for path, text in zip(files, texts):
+        print(json.dumps({"file": path, "transcript": text}))
+    print(f"Transcribed {len(files)} clips in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""ASR benchmarks.
+
+  python -m voice_backend.bench precision --model small [clip.wav ...]
+  python -m voice_backend.bench clip-length --model base [clip.wav ...]
+
+Without clips, sample utterances are synthesised offline with espeak-ng so the
+reference text is known; with user clips, the fp32 transcript is the reference
+(a WER proxy for how much a cheaper precision drifts from full precision).
+"""
+import argparse
+import re
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .asr import MODELS, SAMPLE_RATE, ASRConfig, WhisperASR, load_float32
+
+SAMPLE_SENTENCES = [
+    "I usually spend my weekends with my family in the countryside.",
+    "My favourite subject at school was geography because I loved maps.",
+    "In my opinion, public transport in big cities should be free for students.",
+    "Last summer I travelled to the coast and tried surfing for the first time.",
+    "Reading before bed helps me relax and improves my vocabulary.",
+]
+
+
+def _words(text: str) -> List[str]:
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+def word_error_rate(ref: str, hyp: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length."""
+    r, h = _words(ref), _words(hyp)
+    if not r:
+        return 0.0 if not h else 1.0
+    prev = list(range(len(h) + 1))
+    for i, rw in enumerate(r, 1):
+        cur = [i] + [0] * len(h)
+        for j, hw in enumerate(h, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (rw != hw))
+        prev = cur
+    return prev[-1] / len(r)
+
+
+def resample(pcm: np.ndarray, sr_in: int, sr_out: int = SAMPLE_RATE) -> np.ndarray:
+    """Linear-interpolation resample to float32; good enough for benchmark prompts."""
+    x = pcm.astype(np.float32)
+    if pcm.dtype == np.int16:
+        x /= 32768.0
+    if sr_in == sr_out:
+        return x
+    n_out = int(round(len(x) * sr_out / sr_in))
+    return np.interp(np.linspace(0, len(x) - 1, n_out), np.arange(len(x)), x).astype(np.float32)
+
+
+def synth_samples(sentences: List[str] = SAMPLE_SENTENCES) -> List[Tuple[str, np.ndarray]]:
+    from .tts import EspeakVoice, TTSConfig
+    voice = EspeakVoice(TTSConfig(backend="espeak"))
+    samples = []
+    for text in sentences:
+        pcm, sr = voice.synthesize_pcm(text)
+        samples.append((text, resample(pcm, sr)))
+    return samples
+
+
+def load_clips(paths: List[str]) -> List[Tuple[Optional[str], np.ndarray]]:
+    if paths:
+        return [(None, load_float32(p)) for p in paths]
+    try:
+        return synth_samples()
+    except RuntimeError as e:
+        print(f"No clips given and sample synthesis failed: {e}", file=sys.stderr)
+        sys.exit(2)
+
+
+def bench_precision(args):
+    clips = load_clips(args.clips)
+    audio_s = sum(pcm.size for _, pcm in clips) / SAMPLE_RATE
+    refs = [ref for ref, _ in clips]
+    rows = []
+    for want in args.precisions:
+        asr = WhisperASR(ASRConfig(model_name=args.model, language=args.language,
+                                   device=args.device, precision=want))
+        asr.transcribe(clips[0][1])  # warm-up: first call pays allocator/kernel setup
+        t0 = time.perf_counter()
+        hyps = [asr.transcribe(pcm) for _, pcm in clips]
+        elapsed = time.perf_counter() - t0
+        if refs[0] is None:
+            # User clips have no reference; the first precision's output stands in
+            refs = hyps
+        wer = float(np.mean([word_error_rate(r, h) for r, h in zip(refs, hyps)]))
+        mem = sum(MODELS.memory_report().values())
+        rows.append((want, asr.precision, asr.device, asr.load_seconds, elapsed / len(clips),
+                     elapsed / audio_s, wer, mem))
+        MODELS.unload()
+
+    print(f"model={args.model} clips={len(clips)} audio={audio_s:.1f}s "
+          f"reference={'synthesised text' if args.clips == [] else 'first precision transcript'}")
+    print(f"{'requested':>9} {'used':>5} {'device':>6} {'load s':>7} {'s/clip':>7} {'RTF':>6} {'WER':>6} {'MB':>7}")
+    for want, used, device, load_s, per_clip, rtf, wer, mem in rows:
+        print(f"{want:>9} {used:>5} {device:>6} {load_s:7.2f} {per_clip:7.3f} {rtf:6.3f} {wer:6.3f} {mem / 2**20:7.1f}")
+
+
+def _fit_length(clips: List[np.ndarray], seconds: float) -> np.ndarray:
+    """Concatenate clips (with short gaps) and cut/loop to exactly `seconds`."""
+    gap = np.zeros(int(0.3 * SAMPLE_RATE), dtype=np.float32)
+    joined = np.concatenate([np.concatenate([c, gap]) for c in clips])
+    n = int(seconds * SAMPLE_RATE)
+    reps = int(np.ceil(n / joined.size))
+    return np.tile(joined, reps)[:n]
+
+
+def bench_clip_length(args):
+    clips = [pcm for _, pcm in load_clips(args.clips)]
+    asr = WhisperASR(ASRConfig(model_name=args.model, language=args.language,
+                               device=args.device, precision=args.precision))
+    asr.transcribe(clips[0])  # warm-up
+    print(f"model={args.model} device={asr.device} precision={asr.precision} runs={args.runs}")
+    print(f"{'clip s':>6} {'full s':>7} {'short s':>8} {'speedup':>7} {'fallback':>8} {'WER vs full':>11}")
+    for seconds in args.lengths:
+        pcm = _fit_length(clips, seconds)
+        full_t, short_t, fallbacks = [], [], 0
+        full_text = short_text = ""
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            full_text = asr.transcribe_result(pcm, without_timestamps=True).get("text", "").strip()
+            full_t.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            short = asr.transcribe_short(pcm)
+            short_t.append(time.perf_counter() - t0)
+            if short is None:
+                fallbacks += 1
+            else:
+                short_text = short
+        full_s, short_s = float(np.median(full_t)), float(np.median(short_t))
+        wer = word_error_rate(full_text, short_text) if short_text else float("nan")
+        print(f"{seconds:6.1f} {full_s:7.3f} {short_s:8.3f} {full_s / short_s:6.1f}x "
+              f"{fallbacks:>4}/{args.runs:<3} {wer:11.3f}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="ConversaAI ASR benchmarks")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    bp = sub.add_parser("precision", help="latency / WER across Whisper precisions")
+    bp.add_argument("clips", nargs="*", help="audio files (default: synthesised samples)")
+    bp.add_argument("--model", default="base")
+    bp.add_argument("--language", default="en")
+    bp.add_argument("--device", default="cpu")
+    bp.add_argument("--precisions", nargs="+", default=["fp32", "int8", "bf16"])
+    bp.set_defaults(func=bench_precision)
+    cp = sub.add_parser("clip-length", help="full 30 s window vs reduced encoder context")
+    cp.add_argument("clips", nargs="*", help="audio files (default: synthesised samples)")
+    cp.add_argument("--model", default="base")
+    cp.add_argument("--language", default="en")
+    cp.add_argument("--device", default="cpu")
+    cp.add_argument("--precision", default="auto")
+    cp.add_argument("--lengths", nargs="+", type=float, default=[1, 2, 4, 8, 15, 29])
+    cp.add_argument("--runs", type=int, default=3)
+    cp.set_defaults(func=bench_clip_length)
+    args = p.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+
+
+@dataclass
+class ContextConfig:
+    max_tokens: int = 1000        # approximate budget for summary + recent turns
+    min_messages: int = 4         # most recent messages always kept verbatim
+    summary_max_chars: int = 800
+
+
+def approx_tokens(text: str) -> int:
+    # ~4 characters per token for English; close enough for budgeting
+    return max(1, (len(text) + 3) // 4)
+
+
+_FIRST_SENTENCE = re.compile(r"^(.+?[.!?])(\s|$)")
+
+
+def extractive_summary(summary: str, folded: List[dict], max_chars: int = 800) -> str:
+    """Append one line per folded user message (its first sentence) and keep the newest lines
+    that fit in max_chars. Local and instant, so folding never waits on the LLM.
+    """
+    lines = [line for line in summary.split("\n") if line]
+    for msg in folded:
+        if msg.get("role") != "user":
+            continue
+        text = " ".join(msg.get("content", "").split())
+        m = _FIRST_SENTENCE.match(text)
+        text = m.group(1) if m else text
+        if len(text) > 120:
+            text = text[:117].rstrip() + "..."
+        if text:
+            lines.append(f"- The user said: {text}")
+    kept: List[str] = []
+    total = 0
+    for line in reversed(lines):
+        total += len(line) + 1
+        if total > max_chars:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+
+class ConversationContext:
+    """Bounded conversation history for the LLM prompt.
+
+    Behaves like the list of {"role", "content"} dicts it replaces (append,
+    iterate, len, clear), but once the recent turns exceed the token budget the
+    oldest ones are folded into a short running summary, so prompt size stays
+    roughly constant however long the session runs.
+    """
+
+    def __init__(self, cfg: Optional[ContextConfig] = None,
+                 summarize: Optional[Callable[[str, List[dict]], str]] = None):
+        self.cfg = cfg or ContextConfig()
+        self._summarize = summarize or (lambda s, f: extractive_summary(s, f, self.cfg.summary_max_chars))
+        self.turns: List[dict] = []
+        self.summary = ""
+        self.folded = 0  # messages folded into the summary so far
+
+    def append(self, msg: dict):
+        self.turns.append(msg)
+        self._fold()
+
+    def tokens(self) -> int:
+        total = approx_tokens(self.summary) if self.summary else 0
+        return total + sum(approx_tokens(m.get("content", "")) for m in self.turns)
+
+    def _fold(self):
+        if self.tokens() <= self.cfg.max_tokens:
+            return
+        # Fold whole user/assistant pairs from the front until within budget
+        cut = 0
+        running = self.tokens()
+        while len(self.turns) - cut > self.cfg.min_messages and running > self.cfg.max_tokens:
+            running -= approx_tokens(self.turns[cut].get("content", ""))
+            cut += 1
+        if cut % 2 and len(self.turns) - cut > self.cfg.min_messages:
+            cut += 1
+        if not cut:
+            return
+        folded, self.turns = self.turns[:cut], self.turns[cut:]
+        self.summary = self._summarize(self.summary, folded)
+        self.folded += cut
+
+    def clear(self):
+        self.turns.clear()
+        self.summary = ""
+        self.folded = 0
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.turns)
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __getitem__(self, index):
+        return self.turns[index]
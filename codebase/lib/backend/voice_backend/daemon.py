@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Long-running single-turn engine speaking a JSON-lines protocol.
+
+The Whisper model is loaded once and each session keeps its own history, so a
+turn costs only inference time instead of interpreter start + model load.
+
+One JSON object per line in, one per line out:
+  {"id": 1, "session": "abc", "wav": "/tmp/turn.wav"}   transcribe + reply
+  {"id": 2, "session": "abc", "text": "I goes home"}    reply only
+  add "speak": true for base64 reply audio in "audio" (+ "audio_format"),
+  or "audio_out": PATH to have it written to a file instead;
+  add "timings": true for per-stage milliseconds in "timings"
+  (with --profile DIR, sampled turns also report their profile directory in "profile")
+  {"id": 3, "session": "abc", "op": "reset"}            drop session history
+  {"op": "models"}                                      loaded models + bytes
+  {"op": "stats"}                                       ASR batching + LLM latency metrics
+  {"op": "metrics"}                                     stage latencies as Prometheus text
+  {"op": "ping"} / {"op": "shutdown"}
+Replies mirror engine_invoke.py: {"id", "transcript", "reply"} plus "error".
+
+Serve on stdin/stdout (default) or on a Unix socket with --socket PATH.
+"""
+import argparse
+import base64
+import json
+import os
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+try:
+    from .asr import MODELS
+    from .context import ConversationContext
+    from .metrics import METRICS
+    from .profiling import ProfileConfig, TurnProfiler
+    from .single_turn import SingleTurnEngine, SingleTurnConfig
+except ImportError:
+    # Fallback for direct execution
+    from asr import MODELS
+    from context import ConversationContext
+    from metrics import METRICS
+    from profiling import ProfileConfig, TurnProfiler
+    from single_turn import SingleTurnEngine, SingleTurnConfig
+
+
+class _Session:
+    def __init__(self, history: ConversationContext):
+        self.history = history
+        self.lock = threading.Lock()  # one turn at a time per session, in order
+
+
+class EngineDaemon:
+    def __init__(self, engine: SingleTurnEngine, max_sessions: int = 256):
+        self.engine = engine
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()  # guards self.sessions
+        # Whisper calls are not safe to interleave on one model (the scheduler serialises them itself)
+        self._asr_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def _session(self, session: str) -> _Session:
+        with self._lock:
+            sess = self.sessions.get(session)
+            if sess is None:
+                sess = _Session(self.engine.new_history())
+                self.sessions[session] = sess
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            else:
+                self.sessions.move_to_end(session)
+            return sess
+
+    def handle(self, req: dict) -> dict:
+        op = req.get("op", "turn")
+        session = str(req.get("session", "default"))
+        res: dict = {"id": req.get("id")}
+        if op == "ping":
+            res["ok"] = True
+            return res
+        if op == "models":
+            res["models"] = MODELS.memory_report()
+            return res
+        if op == "stats":
+            res["asr"] = self.engine.scheduler.stats() if self.engine.scheduler else None
+            res["llm"] = self.engine.llm.stats() if self.engine.llm else None
+            return res
+        if op == "metrics":
+            res["metrics"] = METRICS.render_prometheus()
+            return res
+        if op == "shutdown":
+            self.stopped.set()
+            res["ok"] = True
+            return res
+        if op == "reset":
+            with self._lock:
+                self.sessions.pop(session, None)
+            res["ok"] = True
+            return res
+        if op != "turn":
+            res["error"] = f"unknown op: {op}"
+            return res
+
+        wav_path: Optional[str] = req.get("wav")
+        text: Optional[str] = req.get("text")
+        if wav_path is None and text is None:
+            res["error"] = "request needs 'wav' or 'text'"
+            return res
+        if wav_path is not None and not os.path.isfile(wav_path):
+            res["error"] = "File not found"
+            return res
+        timings: dict = {}
+        profiled = METRICS.profiler.begin_turn(timings) if METRICS.profiler else False
+        try:
+            if text is None:
+                if self.engine.scheduler:
+                    # the scheduler serialises model access and batches concurrent sessions
+                    text = self.engine.transcribe(wav_path, timings)
+                else:
+                    with self._asr_lock:
+                        text = self.engine.transcribe(wav_path, timings)
+            # LLM calls of different sessions run concurrently; a session's own turns stay in order
+            sess = self._session(session)
+            with sess.lock:
+                reply = self.engine.respond(text, sess.history, timings)
+            res["transcript"] = text
+            res["reply"] = reply
+            out = req.get("audio_out")
+            if out:
+                with open(out, "wb") as f, METRICS.span("tts", timings):
+                    self.engine.voice.synthesize_to_fp(reply, f)
+                res["audio_out"] = out
+            elif req.get("speak"):
+                with METRICS.span("tts", timings):
+                    data = self.engine.voice.synthesize_bytes(reply)
+                res["audio"] = base64.b64encode(data).decode("ascii")
+                res["audio_format"] = self.engine.voice.format
+            METRICS.inc("turns")
+            if req.get("timings"):
+                res["timings"] = timings
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            res["transcript"] = text or ""
+            res["reply"] = f"Error: {e}"
+            res["error"] = str(e)
+        if profiled:
+            try:
+                res["profile"] = METRICS.profiler.end_turn(timings)
+            except OSError as e:
+                print(f"Profile not written: {e}", file=sys.stderr)
+        return res
+
+    def handle_line(self, line: str) -> Optional[str]:
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            req = json.loads(line)
+            if not isinstance(req, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            return json.dumps({"id": None, "error": f"bad request: {e}"})
+        return json.dumps(self.handle(req))
+
+    def serve_stdio(self, rfile=None, wfile=None):
+        rfile = rfile or sys.stdin
+        wfile = wfile or sys.stdout
+        for line in rfile:
+            out = self.handle_line(line)
+            if out is not None:
+                wfile.write(out + "\n")
+                wfile.flush()
+            if self.stopped.is_set():
+                break
+
+    def serve_unix(self, path: str):
+        daemon = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw in self.rfile:
+                    out = daemon.handle_line(raw.decode("utf-8", "replace"))
+                    if out is not None:
+                        self.wfile.write((out + "\n").encode("utf-8"))
+                        self.wfile.flush()
+                    if daemon.stopped.is_set():
+                        threading.Thread(target=self.server.shutdown, daemon=True).start()
+                        break
+
+        if os.path.exists(path):
+            os.unlink(path)
+        with socketserver.ThreadingUnixStreamServer(path, _Handler) as server:
+            server.daemon_threads = True
+            print(f"Engine daemon listening on {path}", file=sys.stderr)
+            try:
+                server.serve_forever()
+            finally:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+
+def main():
+    p = argparse.ArgumentParser(description="ConversaAI warm single-turn engine daemon")
+    p.add_argument('--socket', default=None, help='serve on this Unix socket path instead of stdin/stdout')
+    p.add_argument('--model', default='base')
+    p.add_argument('--language', default='en')
+    p.add_argument('--device', default='auto')
+    p.add_argument('--precision', default='auto', choices=['auto', 'fp32', 'fp16', 'int8', 'bf16'])
+    p.add_argument('--short-ctx-max-s', type=float, default=0.0,
+                   help='reduced encoder context for clips up to this many seconds (0 = off)')
+    p.add_argument('--cascade-from', default=None, help='try this smaller model first (e.g. tiny)')
+    p.add_argument('--cascade-budget-ms', type=float, default=1500.0)
+    p.add_argument('--batch-window-ms', type=float, default=0.0,
+                   help='micro-batch transcriptions arriving within this window (0 = off)')
+    p.add_argument('--max-batch', type=int, default=8)
+    p.add_argument('--tts-cache', default=None, help='directory for cached synthesised sentences (enables the cache)')
+    p.add_argument('--tts-cache-mb', type=int, default=64, help='TTS cache size limit in MB')
+    p.add_argument('--max-sessions', type=int, default=256)
+    p.add_argument('--profile', default=None, metavar='DIR', help='write per-turn stage profiles into DIR')
+    p.add_argument('--profile-sample', type=float, default=1.0, help='fraction of turns to profile')
+    args = p.parse_args()
+    if args.profile:
+        METRICS.profiler = TurnProfiler(ProfileConfig(out_dir=args.profile, sample=args.profile_sample))
+
+    engine = SingleTurnEngine(SingleTurnConfig(
+        model_name=args.model,
+        language=args.language,
+        device=args.device,
+        precision=args.precision,
+        short_ctx_max_s=args.short_ctx_max_s,
+        cascade_from=args.cascade_from,
+        cascade_budget_ms=args.cascade_budget_ms,
+        batch_window_ms=args.batch_window_ms,
+        max_batch=args.max_batch,
+        tts_cache=args.tts_cache,
+        tts_cache_mb=args.tts_cache_mb,
+        tts_warmup=True,
+    ))
+    daemon = EngineDaemon(engine, max_sessions=args.max_sessions)
+    print("Engine daemon ready.", file=sys.stderr)
+    if args.socket:
+        daemon.serve_unix(args.socket)
+    else:
+        daemon.serve_stdio()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+# Endpointer.push() results
+IDLE = 0    # no speech yet; frame kept only as pre-roll
+ONSET = 1   # this frame started the utterance (pre-roll is now part of it)
+ACTIVE = 2  # inside the utterance
+END = 3     # endpoint reached; utterance is complete
+
+
+@dataclass
+class EndpointConfig:
+    frame_ms: int = 30
+    silence_ms: int = 600            # end the utterance after this much trailing silence
+    preroll_ms: int = 1000           # audio kept from before speech onset
+    hangover_ms: Optional[int] = None  # trailing silence kept in the output; None = all of silence_ms
+    max_utterance_s: float = 60.0    # force an endpoint after this much audio
+    energy_gate_dbfs: float = -55.0  # frames quieter than this skip the VAD call and count as silence
+
+
+class Endpointer:
+    """Frame-by-frame utterance endpointing over a preallocated ring buffer.
+
+    Frames are written into a fixed (n_frames, frame_len) int16 array, so no
+    per-frame allocation or list re-slicing happens however long the user talks.
+    Silence is tracked in frame counts rather than wall-clock time, and a
+    vectorised energy check classifies clearly silent frames without calling
+    the (much slower) WebRTC VAD.
+    """
+
+    def __init__(self, cfg: EndpointConfig, vad, sample_rate: int = 16000):
+        self.cfg = cfg
+        self.vad = vad
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * cfg.frame_ms / 1000)
+        self.preroll_frames = max(0, cfg.preroll_ms // cfg.frame_ms)
+        self.silence_frames = max(1, cfg.silence_ms // cfg.frame_ms)
+        hangover_ms = cfg.silence_ms if cfg.hangover_ms is None else min(cfg.hangover_ms, cfg.silence_ms)
+        self.hangover_frames = max(0, hangover_ms // cfg.frame_ms)
+        self.capacity = self.preroll_frames + int(cfg.max_utterance_s * 1000 / cfg.frame_ms) + 1
+        self._ring = np.zeros((self.capacity, self.frame_len), dtype=np.int16)
+        self._voiced = np.zeros(self.capacity, dtype=np.bool_)
+        # Gate on the sum of squares to avoid a sqrt per frame
+        amp = (10.0 ** (cfg.energy_gate_dbfs / 20.0)) * 32768.0
+        self._energy_gate = amp * amp * self.frame_len
+        self.vad_calls = 0
+        self.gated_frames = 0
+        self.reset()
+
+    def reset(self):
+        self._write = 0         # total frames written (monotonic)
+        self._start = 0         # first frame of the utterance / pre-roll window
+        self._last_voiced = -1  # index of the last voiced frame
+        self._silent_run = 0
+        self.in_speech = False
+        self.done = False
+
+    def _is_speech(self, frame: np.ndarray) -> bool:
+        f = frame.astype(np.float32)
+        if float(np.dot(f, f)) < self._energy_gate:
+            self.gated_frames += 1
+            return False
+        self.vad_calls += 1
+        return self.vad.is_speech(frame.tobytes(), self.sample_rate)
+
+    def push(self, frame: np.ndarray) -> int:
+        if self.done:
+            return END
+        if frame.size != self.frame_len:
+            frame = np.resize(frame, self.frame_len)
+        idx = self._write
+        speech = self._is_speech(frame)
+        self._ring[idx % self.capacity] = frame
+        self._voiced[idx % self.capacity] = speech
+        self._write += 1
+
+        if not self.in_speech:
+            if not speech:
+                # Keep only the pre-roll window
+                self._start = max(self._start, self._write - self.preroll_frames)
+                return IDLE
+            self.in_speech = True
+            self._last_voiced = idx
+            return ONSET
+
+        if speech:
+            self._last_voiced = idx
+            self._silent_run = 0
+        else:
+            self._silent_run += 1
+        if self._silent_run >= self.silence_frames or self._write - self._start >= self.capacity:
+            self.done = True
+            return END
+        return ACTIVE
+
+    @property
+    def trailing_silence_ms(self) -> int:
+        """Silence since the last voiced frame of the current utterance (0 before onset)."""
+        return self._silent_run * self.cfg.frame_ms if self.in_speech else 0
+
+    def _span(self, end: int) -> np.ndarray:
+        return np.arange(self._start, end) % self.capacity
+
+    def _end(self) -> int:
+        if not self.in_speech:
+            return self._write
+        return min(self._write, self._last_voiced + 1 + self.hangover_frames)
+
+    def audio(self) -> np.ndarray:
+        """The utterance so far (pre-roll + speech + hangover) as one int16 array."""
+        rows = self._span(self._end())
+        return self._ring[rows].reshape(-1)
+
+    def voiced_flags(self) -> np.ndarray:
+        """Per-frame speech decisions aligned with audio()."""
+        return self._voiced[self._span(self._end())].copy()
@@ -1,14 +1,25 @@
+import contextlib
 import os
 import tempfile
+import threading
 import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterator, Optional
 
-from .asr import ASRConfig, WhisperASR
-from .audio import AudioConfig, MicRecorder, write_wav
-from .nlp import simple_feedback
-from .llm import GeminiResponder, GeminiConfig
-from .tts import GTTSVoice, TTSConfig
+from .asr import ASRConfig, CascadeASR, CascadeConfig, WhisperASR
+from .audio import (
+    AudioConfig, BargeInDetector, ContinuousCapture, MicRecorder, can_play_pcm, decode_audio, pcm16_to_wav_bytes,
+    play_file, play_pcm, trim_silence,
+)
+from .context import ContextConfig, ConversationContext
+from .nlp import simple_feedback, STOCK_PHRASES
+from .speculative import SpeculativeReply
+from .streaming import StreamingTranscriber
+from .metrics import METRICS
+from .profiling import ProfileConfig, TurnProfiler
+from .llm import GeminiResponder, GeminiConfig, ResilienceConfig, ResilientResponder, StubResponder
+from .pipeline import SpeechPipeline
+from .tts import TTSConfig, make_voice
 
 
 @dataclass
@@ -19,95 +30,445 @@ class EngineConfig:
     silence_ms: int = 700
     vad_aggressiveness: int = 2
     ptt: bool = False
+    continuous: bool = False  # keep the mic open and queue utterances across turns
+    trim_silence: bool = True  # drop leading/trailing silence and long pauses before ASR
+    barge_in: bool = False     # stop the reply as soon as the user starts talking over it
+    barge_in_ms: int = 240     # speech needed to count as an interruption
+    barge_in_dbfs: float = -40.0  # louder than speaker echo should be
     # asr
     model_name: str = "base"
     language: Optional[str] = "en"
     device: str = "auto"
+    precision: str = "auto"  # 'auto' | 'fp32' | 'fp16' | 'int8' | 'bf16'
+    short_ctx_max_s: float = 0.0  # reduced encoder context for clips up to this long; 0 disables
+    cascade_from: Optional[str] = None  # e.g. 'tiny': try this model first, escalate to model_name
+    cascade_budget_ms: float = 1500.0
+    stream_asr: bool = False  # decode partial transcripts while recording
+    speculative: bool = False  # request the reply on the partial transcript during the end-of-turn silence
+    speculative_pause_ms: int = 300
+    # llm
+    stream_reply: bool = False  # speak sentence 1 while sentence 2 is generated
+    stub_llm: bool = False      # offline StubResponder instead of Gemini
+    llm_deadline_s: float = 8.0  # fall back to local feedback after this
+    llm_hedge_after_s: Optional[float] = None  # duplicate a request that is slower than this
+    context_tokens: int = 1000  # history budget; older turns fold into a running summary
     # tts
+    tts_backend: str = "gtts"  # 'gtts' | 'espeak' (offline, in-memory PCM)
+    tts_voice: Optional[str] = None
     tts_lang: str = "en"
     tts_slow: bool = False
+    tts_cache_dir: Optional[str] = None
+    tts_cache_mb: int = 64
+    tts_warmup_file: Optional[str] = None  # extra phrases to pre-synthesise, one per line
+    reply_out: Optional[str] = None  # also write each spoken reply to this file
+    # metrics
+    show_timings: bool = False  # print per-stage timings after each turn
+    metrics_file: Optional[str] = None  # Prometheus text, rewritten after each turn
+    metrics_port: Optional[int] = None  # serve /metrics on this port
+    profile_dir: Optional[str] = None  # write per-turn stage profiles here
+    profile_sample: float = 1.0  # fraction of turns profiled
 
 
 class ConversaEngine:
     def __init__(self, cfg: EngineConfig):
         self.cfg = cfg
-        self.asr = WhisperASR(ASRConfig(model_name=cfg.model_name, language=cfg.language, device=cfg.device))
-        self.voice = GTTSVoice(TTSConfig(lang=cfg.tts_lang, slow=cfg.tts_slow))
+        self.created_at = time.perf_counter()
+        self.first_listen_at: Optional[float] = None
+        # Whisper loads on a background thread while the microphone is opened
+        self.asr = WhisperASR(
+            ASRConfig(
+                model_name=cfg.model_name,
+                language=cfg.language,
+                device=cfg.device,
+                precision=cfg.precision,
+                short_ctx_max_s=cfg.short_ctx_max_s,
+            ),
+            background=True,
+        )
+        if cfg.cascade_from:
+            fast = WhisperASR(
+                ASRConfig(
+                    model_name=cfg.cascade_from,
+                    language=cfg.language,
+                    device=cfg.device,
+                    precision=cfg.precision,
+                ),
+                background=True,
+            )
+            self.asr = CascadeASR(fast, self.asr, CascadeConfig(budget_ms=cfg.cascade_budget_ms))
+        self.voice = make_voice(TTSConfig(
+            lang=cfg.tts_lang,
+            slow=cfg.tts_slow,
+            cache_dir=cfg.tts_cache_dir,
+            cache_max_mb=cfg.tts_cache_mb,
+            backend=cfg.tts_backend,
+            voice=cfg.tts_voice,
+        ))
+        if self.voice.cache is not None:
+            threading.Thread(target=self.voice.warm, args=(self._warmup_phrases(),), daemon=True).start()
         self.audio_cfg = AudioConfig(
             device_index=cfg.device_index,
             chunk_ms=cfg.chunk_ms,
             silence_ms=cfg.silence_ms,
             vad_aggressiveness=cfg.vad_aggressiveness,
             ptt=cfg.ptt,
+            trim_silence=cfg.trim_silence,
         )
-        self.history: list[dict] = []
+        self.capture: Optional[ContinuousCapture] = None
+        self.barge_event = threading.Event()  # set when the user interrupts the current reply
+        self._speak_depth = 0  # nested _speaking() blocks; the outermost owns the monitor
+        self._monitor: Optional[MicRecorder] = None  # barge-in listener while a reply plays
+        self._handoff_mic: Optional[MicRecorder] = None  # monitor that caught the user's next turn
+        self._monitor_lock = threading.Lock()
+        self._pcm_output = True  # cleared once in-process playback fails (no output device)
+        self.timings: dict = {}  # per-stage milliseconds of the current/last turn
+        if cfg.metrics_port:
+            METRICS.serve(cfg.metrics_port)
+            print(f"Metrics on http://127.0.0.1:{cfg.metrics_port}/metrics")
+        if cfg.profile_dir:
+            METRICS.profiler = TurnProfiler(ProfileConfig(out_dir=cfg.profile_dir, sample=cfg.profile_sample))
+        if cfg.continuous and (cfg.stream_asr or cfg.speculative):
+            print("Note: --stream-asr/--speculative are ignored in continuous capture mode.")
+        self.history = ConversationContext(ContextConfig(max_tokens=cfg.context_tokens))
         # Optional Gemini
-        self.gemini: GeminiResponder | None = None
+        self.gemini: GeminiResponder | StubResponder | None = None
         api_key = os.getenv("GEMINI_API_KEY")
-        if api_key:
+        if cfg.stub_llm:
+            self.gemini = StubResponder()
+            print("Stub responder enabled (offline).")
+        elif api_key:
             try:
-                self.gemini = GeminiResponder(GeminiConfig(api_key=api_key))
+                self.gemini = GeminiResponder(GeminiConfig(api_key=api_key, api_endpoint=os.getenv("GEMINI_API_ENDPOINT")))
                 print("Gemini responder enabled.")
             except Exception as e:
                 print(f"Gemini disabled: {e}")
-        # Optional warm-up step to reduce first token latency on GPU
-        try:
-            import torch
-            if torch.cuda.is_available():
-                torch.cuda.synchronize()
-        except Exception:
-            pass
+        self.llm: Optional[ResilientResponder] = None
+        if self.gemini:
+            self.llm = ResilientResponder(self.gemini, ResilienceConfig(
+                deadline_s=cfg.llm_deadline_s,
+                hedge_after_s=cfg.llm_hedge_after_s,
+            ))
+        if cfg.speculative and self.llm is None:
+            print("Note: --speculative needs an LLM responder; ignored.")
+        self.pipeline = SpeechPipeline(self._synth_clip, self._play_clip, stop=self.barge_event)
 
-    def run_once(self) -> bool:
-        """Capture one utterance, transcribe, respond, and speak. Returns False to stop."""
-        with MicRecorder(self.audio_cfg) as mic:
-            pcm16 = mic.record_once()
-        if pcm16.size == 0:
-            print("No audio captured.")
-            return True
+    def startup_report(self, process_start: float) -> dict:
+        """Seconds from process_start (a time.perf_counter() mark) to each startup milestone."""
+        def since(t: Optional[float]) -> Optional[float]:
+            return None if t is None else round(t - process_start, 3)
+        return {
+            "imports_s": since(self.created_at),
+            "first_listen_s": since(self.first_listen_at),
+            "model_ready_s": since(self.asr.ready_at),
+            "model_load_s": None if self.asr.load_seconds is None else round(self.asr.load_seconds, 3),
+        }
 
-        with tempfile.TemporaryDirectory() as td:
-            wav_path = os.path.join(td, "input.wav")
-            write_wav(wav_path, pcm16)
-            text = self.asr.transcribe(wav_path)
+    def _warmup_phrases(self) -> list[str]:
+        phrases = list(STOCK_PHRASES)
+        if self.cfg.tts_warmup_file:
+            try:
+                with open(self.cfg.tts_warmup_file, encoding="utf-8") as f:
+                    phrases.extend(line.strip() for line in f if line.strip())
+            except OSError as e:
+                print(f"TTS warm-up list not loaded: {e}")
+        return phrases
 
-        if not text:
-            print("I couldn't understand that. Let's try again.")
-            return True
+    @contextlib.contextmanager
+    def _speaking(self):
+        # Re-entrant: a whole reply (every sentence clip) shares one set-up and one monitor stream
+        with self._monitor_lock:
+            self._speak_depth += 1
+            outer = self._speak_depth == 1
+        if not outer:
+            try:
+                yield
+            finally:
+                with self._monitor_lock:
+                    self._speak_depth -= 1
+            return
+        # Don't let the continuous capture record our own reply
+        if self.capture is not None:
+            self.capture.muted = True
+        monitor = None
+        if self.cfg.barge_in and not self.barge_event.is_set():
+            # Listen for the user talking over the reply
+            detector = BargeInDetector(
+                self.cfg.vad_aggressiveness,
+                frame_ms=self.cfg.chunk_ms,
+                min_speech_ms=self.cfg.barge_in_ms,
+                energy_dbfs=self.cfg.barge_in_dbfs,
+                triggered=self.barge_event,
+                on_trigger=self._on_barge_in,
+            )
+            if self.capture is not None:
+                self.capture.mic.tap = detector
+            else:
+                try:
+                    monitor = MicRecorder(self.audio_cfg)
+                    monitor.muted = True
+                    monitor.tap = detector
+                    monitor.__enter__()
+                    self._monitor = monitor
+                except Exception as e:
+                    print(f"Note: barge-in disabled for this reply: {e}")
+                    monitor = None
+        try:
+            yield
+        finally:
+            if self.capture is not None:
+                self.capture.mic.tap = None
+                self.capture.muted = False
+            with self._monitor_lock:
+                self._speak_depth -= 1
+                self._monitor = None
+                handed_over = monitor is not None and monitor is self._handoff_mic
+                if monitor is not None:
+                    monitor.tap = None
+            if monitor is not None and not handed_over:
+                monitor.__exit__(None, None, None)
 
-        fb = None
-        if self.gemini:
+    def _on_barge_in(self, frames):
+        # Runs on the audio callback thread
+        if self.capture is not None:
+            # Hand the interrupting speech to the segmenter, then let the rest through
+            for f in frames:
+                self.capture.mic.q.put(f)
+            self.capture.muted = False
+            return
+        with self._monitor_lock:
+            monitor = self._monitor
+            if monitor is None:
+                return  # reply already over
+            # Keep the monitor open and record the interrupting speech into it;
+            # the next turn records from this stream instead of opening a new one
+            for f in frames:
+                monitor.q.put(f)
+            monitor.muted = False
+            self._handoff_mic = monitor
+
+    def _play_pcm(self, pcm, samplerate: int) -> bool:
+        if self.barge_event.is_set():
+            return False
+        if self._pcm_output:
+            with self._speaking():
+                try:
+                    return play_pcm(pcm, samplerate, self.barge_event if self.cfg.barge_in else None)
+                except Exception as e:  # sd.PortAudioError, e.g. no output device
+                    print(f"Note: in-process playback failed ({e}); using ffplay.")
+                    self._pcm_output = False
+        return self._play_file(pcm16_to_wav_bytes(pcm, samplerate), "wav")
+
+    def _play(self, data: bytes) -> bool:
+        """Play encoded reply audio from memory; ffplay on a temp file is only a fallback."""
+        if self.barge_event.is_set():
+            return False
+        pcm = None
+        if self._pcm_output and can_play_pcm():
             try:
-                llm_reply = self.gemini.reply(self.history, text)
-                fb = type("FB", (), {"reply": llm_reply, "tips": []})
-            except Exception as e:
-                print(f"Gemini error: {e}. Falling back to local feedback.")
-        if fb is None:
-            fb = simple_feedback(text)
-        print(f"User: {text}")
-        print(f"Assistant: {fb.reply}")
+                pcm, sr = decode_audio(data)
+            except (RuntimeError, OSError) as e:
+                print(f"Note: in-process decode failed ({e}); using ffplay.")
+        if pcm is not None:
+            return self._play_pcm(pcm, sr)
+        return self._play_file(data, self.voice.format)
+
+    def _play_file(self, data: bytes, fmt: str) -> bool:
+        fd, path = tempfile.mkstemp(suffix="." + fmt)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            with self._speaking():
+                ok = play_file(path)
+        finally:
+            os.unlink(path)
+        if not ok:
+            print("Note: ffplay not found. Install FFmpeg to auto-play replies.")
+        return True
+
+    def _synth_clip(self, text: str):
+        with METRICS.span("tts", self.timings):
+            if self.voice.pcm:
+                return self.voice.synthesize_pcm(text)
+            return self.voice.synthesize_bytes(text)
+
+    def _play_clip(self, clip) -> bool:
+        with METRICS.span("playback", self.timings):
+            if isinstance(clip, bytes):
+                return self._play(clip)
+            return self._play_pcm(*clip)
+
+    def _save_reply(self, data: bytes):
+        # Optional file sink for the spoken reply (--save-reply)
+        try:
+            with open(self.cfg.reply_out, "wb") as f:
+                f.write(data)
+            print(f"Spoken reply saved to {self.cfg.reply_out}")
+        except OSError as e:
+            print(f"Reply audio not saved: {e}")
+
+    def _reply_chunks(self, text: str) -> Iterator[str]:
+        """Stream the LLM reply, falling back to local feedback if it fails early."""
+        if self.llm is None:
+            yield simple_feedback(text).reply
+            return
+        # Deadline-bounded like reply(); yields local feedback itself if nothing arrives
+        yield from METRICS.span_iter("llm", self.llm.stream_reply(self.history, text), self.timings)
+
+    def _log_turn(self, text: str, reply: str):
         # Update history for context
         self.history.append({"role": "user", "content": text})
-        self.history.append({"role": "assistant", "content": fb.reply})
+        self.history.append({"role": "assistant", "content": reply})
 
         # Append to transcript log
         log_path = os.path.join(os.getcwd(), "transcript.log")
         try:
             with open(log_path, "a", encoding="utf-8") as logf:
                 logf.write(f"USER\t{text}\n")
-                logf.write(f"ASSISTANT\t{fb.reply}\n")
+                logf.write(f"ASSISTANT\t{reply}\n")
         except Exception:
             pass
 
-        # Synthesize to MP3 and attempt playback via ffplay (FFmpeg)
-        out_mp3 = os.path.join(os.getcwd(), "reply.mp3")
-        self.voice.synthesize_to_file(fb.reply, out_mp3)
-        print(f"Spoken reply saved to {out_mp3}")
+    def close(self):
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        if self._handoff_mic is not None:
+            self._handoff_mic.__exit__(None, None, None)
+            self._handoff_mic = None
+
+    def _next_utterance(self):
+        if self.capture is None:
+            self.capture = ContinuousCapture(self.audio_cfg).start()
+            self.first_listen_at = time.perf_counter()
+        if self.capture.utterances.empty():
+            print("Listening… (Ctrl+C to quit)")
+        return self.capture.get()
+
+    def run_once(self) -> bool:
+        """Capture one utterance, transcribe, respond, and speak. Returns False to stop."""
+        self.timings = {}
+        profiled = METRICS.profiler.begin_turn(self.timings) if METRICS.profiler else False
+        t0 = time.perf_counter()
         try:
-            import subprocess
-            subprocess.run([
-                "ffplay", "-nodisp", "-autoexit", "-loglevel", "error", out_mp3
-            ], check=False)
-        except FileNotFoundError:
-            print("Note: ffplay not found. Install FFmpeg to auto-play replies.")
+            return self._turn()
+        finally:
+            self.timings["total_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+            METRICS.inc("turns")
+            if profiled:
+                print(f"(profile written to {METRICS.profiler.end_turn(self.timings)})")
+            if self.cfg.show_timings:
+                print("(timings: " + ", ".join(f"{k} {v:.0f}" for k, v in self.timings.items()) + ")")
+            if self.cfg.metrics_file:
+                try:
+                    METRICS.dump(self.cfg.metrics_file)
+                except OSError as e:
+                    print(f"Metrics not written: {e}")
+
+    @staticmethod
+    def _tail_trimmer(mic: MicRecorder):
+        flags = mic.endpointer.voiced_flags()  # per frame of the streamed audio (both start at onset)
+
+        def trim(tail, start: int):
+            voiced = flags[start // mic.block_size:]
+            out, _ = trim_silence(tail, frame_ms=mic.cfg.chunk_ms, voiced=voiced, max_pause_ms=mic.cfg.max_pause_ms)
+            return out
+        return trim
+
+    def _turn(self) -> bool:
+        stream = None
+        spec = None
+        with METRICS.span("capture", self.timings):
+            if self.cfg.continuous:
+                pcm16 = self._next_utterance()
+                mic = self.capture.mic
+            else:
+                on_partial = lambda t: print(f"… {t}")
+                if self.cfg.speculative and self.llm is not None:
+                    spec = SpeculativeReply(self.llm, self.history, self.cfg.speculative_pause_ms)
+                    on_partial = lambda t: (print(f"… {t}"), spec.on_partial(t))
+                if self.cfg.stream_asr or spec is not None:
+                    stream = StreamingTranscriber(self.asr, on_partial=on_partial)
+                # After a barge-in the monitor already holds the start of this turn
+                recorder = self._handoff_mic or MicRecorder(self.audio_cfg)
+                self._handoff_mic = None
+                with recorder as mic:
+                    if self.first_listen_at is None:
+                        self.first_listen_at = time.perf_counter()
+                    if spec is not None:
+                        def on_frame(frame):
+                            stream.feed(frame)
+                            spec.on_silence(mic.endpointer.trailing_silence_ms, stream.request_partial)
+                    else:
+                        on_frame = stream.feed if stream else None
+                    pcm16 = mic.record_once(on_frame=on_frame)
+        if mic.last_endpoint_ms:
+            METRICS.observe("endpoint_wait", mic.last_endpoint_ms / 1000.0, self.timings)
+        if not self.cfg.continuous:
+            if mic.last_trim is not None and mic.last_trim.removed_ms > 0:
+                t = mic.last_trim
+                print(f"(trimmed {t.removed_ms} ms of silence: {t.input_ms} → {t.output_ms} ms)")
+        if pcm16.size == 0:
+            if stream is not None:
+                stream.finish()
+            if spec is not None:
+                spec.cancel()
+            print("No audio captured.")
+            return True
+
+        with METRICS.span("asr", self.timings):
+            if stream is not None:
+                # The streamed audio still has the end-of-turn silence; trim the tail like record_once
+                text = stream.finish(self._tail_trimmer(mic) if self.audio_cfg.trim_silence else None)
+            else:
+                text = self.asr.transcribe(pcm16)
+
+        if not text:
+            if spec is not None:
+                spec.cancel()
+            print("I couldn't understand that. Let's try again.")
+            return True
+
+        self.barge_event.clear()
+        reply = None
+        if spec is not None:
+            # With --stream-reply a miss is re-asked as a stream below
+            with METRICS.span("llm", self.timings):
+                reply = spec.resolve(text, reissue=not self.cfg.stream_reply)
+            if spec.hit is not None:
+                print(f"(speculative reply {'used' if spec.hit else 'discarded'})")
+
+        if self.cfg.stream_reply:
+            print(f"User: {text}")
+            # An already finished speculative reply is spoken as one chunk
+            # One barge-in monitor for the whole reply rather than one per sentence
+            with self._speaking():
+                reply = self.pipeline.run([reply] if reply else self._reply_chunks(text))
+            print(f"Assistant: {reply}")
+            if self.pipeline.first_audio_s is not None:
+                print(f"(first audio after {self.pipeline.first_audio_s:.2f}s)")
+            if self.pipeline.interrupted:
+                print("(reply interrupted)")
+            self._log_turn(text, reply)
+            return True
+
+        if reply is None:
+            # Bounded by the LLM deadline; falls back to local feedback on its own
+            with METRICS.span("llm", self.timings):
+                reply = self.llm.reply(self.history, text) if self.llm else simple_feedback(text).reply
+        print(f"User: {text}")
+        print(f"Assistant: {reply}")
+        self._log_turn(text, reply)
+
+        if self.voice.pcm and not self.cfg.reply_out:
+            # Local voice: play straight from memory
+            done = self._play_clip(self._synth_clip(reply))
+        else:
+            # Synthesize into memory, then decode and play it in-process
+            with METRICS.span("tts", self.timings):
+                data = self.voice.synthesize_bytes(reply)
+            if self.cfg.reply_out:
+                self._save_reply(data)
+            done = self._play_clip(data)
+        if not done:
+            print("(reply interrupted)")
         return True
@@ -1,30 +1,63 @@
 #!/usr/bin/env python3
 """Helper script to perform a single turn (transcribe+reply) for a given WAV file.
-Prints JSON {"transcript": str, "reply": str} to stdout.
+Prints JSON {"transcript": str, "reply": str} to stdout, plus "timings"
+(per-stage milliseconds) with --timings. --profile DIR writes cProfile,
+collapsed-stack and (for Whisper) torch profiler traces of the turn into DIR.
 """
-import json, sys, os, tempfile
+import argparse, json, sys, os, time
 try:
     from .single_turn import SingleTurnEngine, SingleTurnConfig
+    from .metrics import METRICS
+    from .profiling import ProfileConfig, TurnProfiler
 except ImportError:
     # Fallback for direct execution
     from single_turn import SingleTurnEngine, SingleTurnConfig
+    from metrics import METRICS
+    from profiling import ProfileConfig, TurnProfiler
 
-try:
-    wav_path = sys.argv[1]
-except IndexError:
-    print("Usage: engine_invoke.py <wav_path>", file=sys.stderr)
-    sys.exit(2)
+p = argparse.ArgumentParser(usage="engine_invoke.py <wav_path> [--timings] [--metrics-file PATH] [--tts-cache DIR] [--profile DIR]")
+p.add_argument("wav_path")
+p.add_argument("--timings", action="store_true", help="add per-stage timings (ms) to the JSON output")
+p.add_argument("--metrics-file", default=None, help="write Prometheus-format stage metrics to this file")
+p.add_argument("--tts-cache", default=None, help="directory for cached synthesised sentences (shared across runs)")
+p.add_argument("--profile", default=None, metavar="DIR", help="write per-stage profiles of this turn into DIR")
+p.add_argument("--profile-sample", type=float, default=1.0, help="probability of profiling this invocation")
+args = p.parse_args()
+wav_path = args.wav_path
 
 if not os.path.isfile(wav_path):
     print("File not found", file=sys.stderr)
     sys.exit(3)
 
+timings = {}
+profiled = False
+if args.profile:
+    METRICS.profiler = TurnProfiler(ProfileConfig(out_dir=args.profile, sample=args.profile_sample))
+    profiled = METRICS.profiler.begin_turn(timings)
+t0 = time.perf_counter()
 try:
-    engine = SingleTurnEngine(SingleTurnConfig())
-    text = engine.transcribe(wav_path)
-    reply = engine.respond(text)
-    json.dump({"transcript": text, "reply": reply}, sys.stdout)
+    engine = SingleTurnEngine(SingleTurnConfig(tts_cache=args.tts_cache))
+    timings["load_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    text = engine.transcribe(wav_path, timings=timings)
+    reply = engine.respond(text, timings=timings)
+    timings["total_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    out = {"transcript": text, "reply": reply}
+    if args.timings:
+        out["timings"] = timings
+    json.dump(out, sys.stdout)
 except Exception as e:
     print(f"Error: {e}", file=sys.stderr)
     json.dump({"transcript": "", "reply": f"Error: {e}"}, sys.stdout)
     sys.exit(1)
+finally:
+    if args.metrics_file:
+        try:
+            METRICS.inc("turns")
+            METRICS.dump(args.metrics_file)
+        except OSError as e:
+            print(f"Metrics not written: {e}", file=sys.stderr)
+    if profiled:
+        try:
+            print(f"Profile written to {METRICS.profiler.end_turn(timings)}", file=sys.stderr)
+        except OSError as e:
+            print(f"Profile not written: {e}", file=sys.stderr)
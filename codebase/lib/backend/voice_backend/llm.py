@@ -1,5 +1,22 @@
+import asyncio
+import concurrent.futures
+import queue
+import sys
+import threading
+import time
+from collections import Counter
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional
+
+try:
+    from .context import ConversationContext
+    from .metrics import Histogram
+    from .nlp import simple_feedback
+except ImportError:
+    # Fallback for direct execution
+    from context import ConversationContext
+    from metrics import Histogram
+    from nlp import simple_feedback
 
 
 PERSONA_PROMPT = (
@@ -20,6 +37,7 @@ class GeminiConfig:
     model: str = "gemini-1.5-flash"
     # model: str = "gemini-2.5-flash"
     api_key: Optional[str] = None
+    api_endpoint: Optional[str] = None  # e.g. 'localhost:8080' for a fake server (REST transport)
 
 
 class GeminiResponder:
@@ -31,23 +49,349 @@ class GeminiResponder:
             raise RuntimeError("google-generativeai is not installed.") from e
         if not cfg.api_key:
             raise RuntimeError("GENAI API key not provided.")
-        genai.configure(api_key=cfg.api_key)
+        if cfg.api_endpoint:
+            genai.configure(api_key=cfg.api_key, transport="rest",
+                            client_options={"api_endpoint": cfg.api_endpoint})
+        else:
+            genai.configure(api_key=cfg.api_key)
+        self.cfg = cfg
         self._genai = genai
-        self._model = genai.GenerativeModel(cfg.model)
+        # The persona goes in the system instruction instead of being resent as a turn
+        try:
+            self._model = genai.GenerativeModel(cfg.model, system_instruction=PERSONA_PROMPT)
+            self._system_instruction = True
+        except TypeError:
+            # google-generativeai < 0.5 has no system_instruction
+            self._model = genai.GenerativeModel(cfg.model)
+            self._system_instruction = False
 
-    def reply(self, history: List[dict], user_text: str) -> str:
-        # history: list of {role: "user"|"assistant", content: str}
-        messages = [
-            {"role": "user", "parts": PERSONA_PROMPT},
-        ]
-        for turn in history[-6:]:  # keep it short
+    def _request(self, history: List[dict], user_text: str):
+        """(model, contents) for a reply to user_text.
+        history: a ConversationContext (bounded, with a running summary) or a
+        plain list of {role: "user"|"assistant", content: str}.
+        """
+        if isinstance(history, ConversationContext):
+            turns, summary = list(history), history.summary
+        else:
+            turns, summary = history[-6:], ""  # keep it short
+        model = self._model
+        messages = []
+        if self._system_instruction:
+            if summary:
+                model = self._genai.GenerativeModel(
+                    self.cfg.model,
+                    system_instruction=f"{PERSONA_PROMPT}\n\nEarlier in this conversation:\n{summary}",
+                )
+        else:
+            persona = PERSONA_PROMPT if not summary else f"{PERSONA_PROMPT}\n\nEarlier in this conversation:\n{summary}"
+            messages.append({"role": "user", "parts": persona})
+        for turn in turns:
             role = "user" if turn.get("role") == "user" else "model"
             messages.append({"role": role, "parts": turn.get("content", "")})
         messages.append({"role": "user", "parts": user_text})
+        return model, messages
 
-        resp = self._model.generate_content(messages)
+    def stream_reply(self, history: List[dict], user_text: str) -> Iterator[str]:
+        """Yield reply text fragments as Gemini generates them."""
+        model, messages = self._request(history, user_text)
+        resp = model.generate_content(messages, stream=True)
+        for chunk in resp:
+            text = getattr(chunk, "text", "")
+            if text:
+                yield text.replace("*", "")
+
+    def reply(self, history: List[dict], user_text: str) -> str:
+        model, messages = self._request(history, user_text)
+        resp = model.generate_content(messages)
         # google-generativeai returns .text
         text = getattr(resp, "text", "").strip()
         # print(text)
         text = text.replace("*", "")
         return text or "Could you tell me a bit more?"
+
+    async def reply_async(self, history: List[dict], user_text: str) -> str:
+        if self.cfg.api_endpoint:
+            # the REST transport has no async client
+            return await asyncio.to_thread(self.reply, history, user_text)
+        model, messages = self._request(history, user_text)
+        resp = await model.generate_content_async(messages)
+        text = getattr(resp, "text", "").strip().replace("*", "")
+        return text or "Could you tell me a bit more?"
+
+
+class StubResponder:
+    """Offline stand-in for GeminiResponder.
+    Streams the local feedback reply word by word with a per-word delay,
+    mimicking token streaming so the reply pipeline can run without network.
+    """
+
+    def __init__(self, delay_s: float = 0.05):
+        self.delay_s = delay_s
+
+    def stream_reply(self, history: List[dict], user_text: str) -> Iterator[str]:
+        words = simple_feedback(user_text).reply.split(" ")
+        for i, word in enumerate(words):
+            if self.delay_s:
+                time.sleep(self.delay_s)
+            yield word if i == len(words) - 1 else word + " "
+
+    def reply(self, history: List[dict], user_text: str) -> str:
+        return "".join(self.stream_reply(history, user_text))
+
+    async def reply_async(self, history: List[dict], user_text: str) -> str:
+        words = simple_feedback(user_text).reply.split(" ")
+        await asyncio.sleep(self.delay_s * len(words))
+        return " ".join(words)
+
+
+@dataclass
+class ResilienceConfig:
+    deadline_s: float = 8.0                # give up and use local feedback after this
+    hedge_after_s: Optional[float] = None  # send a second request if the first is this slow
+    first_chunk_s: float = 4.0             # streamed replies: give up if nothing arrives by then
+    breaker_failures: int = 3              # consecutive failures that open the breaker
+    breaker_cooldown_s: float = 30.0       # time before a trial request is let through
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int, cooldown_s: float):
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self._streak = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True  # exactly one probe while half-open
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._streak = 0
+            self._opened_at = None
+            self._trial = False
+
+    def abandon(self):
+        # A cancelled request neither proves nor disproves recovery; free the probe slot
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._streak += 1
+            if self._trial or self._streak >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class ResilientResponder:
+    """Deadline, hedging and a circuit breaker around a responder.
+
+    reply() never raises and never blocks past deadline_s: on timeout, error
+    or an open breaker it answers with simple_feedback instead. Requests run on
+    a private event loop thread, so reply() can be called from any thread and
+    reply_async() from that loop's callers alike.
+    """
+
+    def __init__(self, responder, cfg: Optional[ResilienceConfig] = None):
+        self.responder = responder
+        self.cfg = cfg or ResilienceConfig()
+        self.breaker = CircuitBreaker(self.cfg.breaker_failures, self.cfg.breaker_cooldown_s)
+        self.latency = Histogram()  # successful LLM replies only
+        self.first_chunk = Histogram()  # streamed replies: time to the first fragment
+        self.outcomes: Counter = Counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _request(self, history: List[dict], user_text: str) -> "asyncio.Future[str]":
+        if hasattr(self.responder, "reply_async"):
+            return asyncio.ensure_future(self.responder.reply_async(history, user_text))
+        return asyncio.ensure_future(asyncio.to_thread(self.responder.reply, history, user_text))
+
+    async def _hedged(self, history: List[dict], user_text: str) -> str:
+        pending = {self._request(history, user_text)}
+        hedge = self.cfg.hedge_after_s
+        if hedge is not None and hedge < self.cfg.deadline_s:
+            done, _ = await asyncio.wait(pending, timeout=hedge)
+            if not done:
+                self.outcomes["hedged"] += 1
+                pending.add(self._request(history, user_text))
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def reply_async(self, history: List[dict], user_text: str) -> str:
+        if not self.breaker.allow():
+            self.outcomes["short_circuit"] += 1
+            return simple_feedback(user_text).reply
+        t0 = time.perf_counter()
+        try:
+            text = await asyncio.wait_for(self._hedged(history, user_text), self.cfg.deadline_s)
+        except asyncio.CancelledError:
+            self.outcomes["cancelled"] += 1
+            self.breaker.abandon()
+            raise
+        except asyncio.TimeoutError:
+            self.outcomes["timeout"] += 1
+            self.breaker.record_failure()
+            print(f"[llm] no reply within {self.cfg.deadline_s:.1f}s; using local feedback", file=sys.stderr)
+            return simple_feedback(user_text).reply
+        except Exception as e:
+            self.outcomes["error"] += 1
+            self.breaker.record_failure()
+            print(f"[llm] {e}; using local feedback", file=sys.stderr)
+            return simple_feedback(user_text).reply
+        self.latency.observe(time.perf_counter() - t0)
+        self.outcomes["ok"] += 1
+        self.breaker.record_success()
+        return text
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    def submit(self, history: List[dict], user_text: str) -> "concurrent.futures.Future[str]":
+        """Start a reply in the background; cancelling the future cancels the request."""
+        return asyncio.run_coroutine_threadsafe(self.reply_async(history, user_text), self._ensure_loop())
+
+    def reply(self, history: List[dict], user_text: str) -> str:
+        return self.submit(history, user_text).result()
+
+    def _produce(self, idx: int, history: List[dict], user_text: str, out: "queue.Queue", stop: threading.Event):
+        try:
+            for chunk in self.responder.stream_reply(history, user_text):
+                if stop.is_set():
+                    return
+                out.put((idx, "chunk", chunk))
+            out.put((idx, "done", None))
+        except Exception as e:
+            out.put((idx, "error", e))
+
+    def _start_stream(self, idx: int, history: List[dict], user_text: str, out: "queue.Queue", stop: threading.Event):
+        threading.Thread(target=self._produce, args=(idx, history, user_text, out, stop), daemon=True).start()
+
+    def stream_reply(self, history: List[dict], user_text: str) -> Iterator[str]:
+        """Reply fragments as the responder streams them, under the same guarantees as reply().
+
+        Nothing arriving within first_chunk_s (or deadline_s, if shorter; hedged
+        after hedge_after_s) or the stream running past deadline_s counts as a
+        failure; if nothing was yielded yet, local feedback is yielded instead. The responder's generator runs on
+        its own thread, so a stalled network read never blocks the caller past
+        the deadlines. Closing this generator early releases a half-open probe.
+        """
+        if not hasattr(self.responder, "stream_reply"):
+            yield self.reply(history, user_text)
+            return
+        if not self.breaker.allow():
+            self.outcomes["short_circuit"] += 1
+            yield simple_feedback(user_text).reply
+            return
+        out: "queue.Queue" = queue.Queue()
+        stop = threading.Event()
+        t0 = time.perf_counter()
+        self._start_stream(0, history, user_text, out, stop)
+        running = {0}
+        # The first fragment never gets longer than the whole reply's deadline
+        first_wait = min(self.cfg.first_chunk_s, self.cfg.deadline_s)
+        hedge = self.cfg.hedge_after_s
+        hedged = hedge is None or hedge >= first_wait
+        chosen: Optional[int] = None  # the request whose fragments are being yielded
+        yielded = False
+        finished = False
+        try:
+            while True:
+                elapsed = time.perf_counter() - t0
+                if chosen is None:
+                    limit = first_wait if hedged else hedge
+                else:
+                    limit = self.cfg.deadline_s
+                try:
+                    idx, kind, payload = out.get(timeout=max(0.0, limit - elapsed))
+                except queue.Empty:
+                    if chosen is None and not hedged:
+                        hedged = True
+                        self.outcomes["hedged"] += 1
+                        self._start_stream(1, history, user_text, out, stop)
+                        running.add(1)
+                        continue
+                    self.outcomes["timeout"] += 1
+                    self.breaker.record_failure()
+                    if chosen is None:
+                        print(f"[llm] no reply within {first_wait:.1f}s; using local feedback", file=sys.stderr)
+                    else:
+                        print(f"[llm] reply not finished within {self.cfg.deadline_s:.1f}s; cut short", file=sys.stderr)
+                    break
+                if chosen is not None and idx != chosen:
+                    continue
+                if chosen is None and kind == "chunk" and time.perf_counter() - t0 > self.cfg.deadline_s:
+                    # Raced past the deadline: local feedback beats a reply that would be cut short
+                    self.outcomes["timeout"] += 1
+                    self.breaker.record_failure()
+                    print(f"[llm] no reply within {self.cfg.deadline_s:.1f}s; using local feedback", file=sys.stderr)
+                    break
+                if kind == "chunk":
+                    if chosen is None:
+                        chosen = idx
+                        self.first_chunk.observe(time.perf_counter() - t0)
+                    yielded = True
+                    yield payload
+                elif kind == "done":
+                    self.latency.observe(time.perf_counter() - t0)
+                    self.outcomes["ok"] += 1
+                    self.breaker.record_success()
+                    finished = True
+                    if not yielded:
+                        yield "Could you tell me a bit more?"
+                    return
+                else:
+                    running.discard(idx)
+                    if chosen is None and running:
+                        continue  # the other hedged request may still answer
+                    self.outcomes["error"] += 1
+                    self.breaker.record_failure()
+                    print(f"[llm] {payload}; using local feedback", file=sys.stderr)
+                    break
+            finished = True
+            if not yielded:
+                yield simple_feedback(user_text).reply
+        finally:
+            stop.set()
+            if not finished:
+                # Closed early (client went away, reply interrupted): neither success nor failure
+                self.outcomes["cancelled"] += 1
+                self.breaker.abandon()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "breaker": self.breaker.state,
+            "outcomes": dict(self.outcomes),
+            "latency_s": self.latency.snapshot(),
+            "first_chunk_s": self.first_chunk.snapshot(),
+        }
@@ -0,0 +1,202 @@
+import bisect
+import contextlib
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+
+# Seconds; spans a cached TTS lookup up to a slow LLM reply
+DEFAULT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus-style), safe across threads."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (max for the +Inf bucket)."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for i, n in enumerate(self._counts):
+                seen += n
+                if seen >= rank and n:
+                    return self.buckets[i] if i < len(self.buckets) else self.max
+            return self.max
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            cumulative = []
+            total = 0
+            for n in self._counts[:-1]:
+                total += n
+                cumulative.append(total)
+            snap = {
+                "count": self.count,
+                "sum": round(self.sum, 4),
+                "max": round(self.max, 4),
+                "buckets": {str(b): c for b, c in zip(self.buckets, cumulative)},
+            }
+        snap["p50"] = self.quantile(0.5)
+        snap["p99"] = self.quantile(0.99)
+        return snap
+
+
+# Turn stages timed by the engines
+STAGES = ("capture", "endpoint_wait", "asr", "llm", "tts", "playback")
+
+
+class Metrics:
+    """Process-wide stage latency histograms and counters.
+
+    span(stage) times a block into the stage histogram (and optionally into a
+    per-turn timings dict); render_prometheus() exposes everything in the
+    Prometheus text format for a /metrics endpoint or a dump file.
+    """
+
+    def __init__(self, prefix: str = "conversa"):
+        self.prefix = prefix
+        self._stages: Dict[str, Histogram] = {stage: Histogram() for stage in STAGES}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.profiler = None  # profiling.TurnProfiler when profiling is enabled
+
+    def histogram(self, stage: str) -> Histogram:
+        with self._lock:
+            hist = self._stages.get(stage)
+            if hist is None:
+                hist = self._stages[stage] = Histogram()
+            return hist
+
+    def observe(self, stage: str, seconds: float, timings: Optional[dict] = None):
+        self.histogram(stage).observe(seconds)
+        if timings is not None:
+            key = f"{stage}_ms"
+            timings[key] = round(timings.get(key, 0.0) + seconds * 1000.0, 1)
+
+    def inc(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    @contextlib.contextmanager
+    def span(self, stage: str, timings: Optional[dict] = None):
+        profile = self.profiler.stage(stage, timings) if self.profiler else contextlib.nullcontext()
+        with profile:
+            t0 = time.perf_counter()
+            try:
+                yield
+            except Exception:
+                self.inc(f"{stage}_errors")
+                raise
+            finally:
+                self.observe(stage, time.perf_counter() - t0, timings)
+
+    def span_iter(self, stage: str, iterable: Iterable, timings: Optional[dict] = None) -> Iterator:
+        """Yield from iterable, timing (and profiling) only the pulls as one stage observation.
+
+        Unlike wrapping the loop in span(), the consumer's time between items
+        (synthesis, playback, network writes) is not counted under the stage.
+        """
+        it = iter(iterable)
+        spent = 0.0
+        try:
+            while True:
+                profile = self.profiler.stage(stage, timings) if self.profiler else contextlib.nullcontext()
+                with profile:
+                    t0 = time.perf_counter()
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        return
+                    except Exception:
+                        self.inc(f"{stage}_errors")
+                        raise
+                    finally:
+                        spent += time.perf_counter() - t0
+                yield item
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+            self.observe(stage, spent, timings)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+        return {
+            "stages": {name: hist.snapshot() for name, hist in sorted(stages.items())},
+            "counters": counters,
+        }
+
+    def render_prometheus(self) -> str:
+        p = self.prefix
+        with self._lock:
+            stages = sorted(self._stages.items())
+            counters = sorted(self._counters.items())
+        lines = [
+            f"# HELP {p}_stage_seconds Latency of each turn stage.",
+            f"# TYPE {p}_stage_seconds histogram",
+        ]
+        for stage, hist in stages:
+            snap = hist.snapshot()
+            for le, count in snap["buckets"].items():
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+            lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {snap["count"]}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {snap["sum"]}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {snap["count"]}')
+        for name, value in counters:
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Write the Prometheus text atomically (e.g. for node_exporter's textfile collector)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve GET /metrics on a background thread; returns the server."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+METRICS = Metrics()
@@ -2,6 +2,21 @@ import re
 from dataclasses import dataclass
 
 
+NO_SPEECH_REPLY = "I didn't catch anything. Could you say that again?"
+TIP_FULL_SENTENCE = "Try speaking in a full sentence to practice structure."
+TIP_PAST_TENSE = "When talking about the past, ensure verbs are in past tense."
+TIP_CONTRACTIONS = "Try using contractions like don't, can't, won't in casual speech."
+
+# Fixed sentences simple_feedback emits verbatim; handy for TTS cache warm-up
+# (the cache stores sentences, so these hit even when the reply quotes the user)
+STOCK_PHRASES = [
+    NO_SPEECH_REPLY,
+    "I didn't catch anything. Could you repeat?",  # SingleTurnEngine.respond
+    *(f"Nice! Here's a tip: {tip}" for tip in (TIP_FULL_SENTENCE, TIP_PAST_TENSE, TIP_CONTRACTIONS)),
+    "Nice! Tell me more about that.",
+]
+
+
 @dataclass
 class Feedback:
     reply: str
@@ -14,22 +29,22 @@ def simple_feedback(user_text: str) -> Feedback:
 
     # basic suggestions
     if not text:
-        return Feedback(reply="I didn't catch anything. Could you say that again?", tips=[])
+        return Feedback(reply=NO_SPEECH_REPLY, tips=[])
 
     # Capitalize I when used as pronoun
     fixed = re.sub(r"\b(i)\b", "I", text, flags=re.IGNORECASE)
 
     # Encourage longer sentences
     if len(text.split()) < 4:
-        tips.append("Try speaking in a full sentence to practice structure.")
+        tips.append(TIP_FULL_SENTENCE)
 
     # Suggest past tense if yesterday appears
     if re.search(r"yesterday", text, re.IGNORECASE):
-        tips.append("When talking about the past, ensure verbs are in past tense.")
+        tips.append(TIP_PAST_TENSE)
 
     # Common contractions suggestion
     if re.search(r"do not|can not|will not", text, re.IGNORECASE):
-        tips.append("Try using contractions like don't, can't, won't in casual speech.")
+        tips.append(TIP_CONTRACTIONS)
 
     # Build reply
     reply = f"You said: ‘{fixed}’. Nice! "
@@ -0,0 +1,136 @@
+import queue
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+
+# End of sentence: terminal punctuation, optional closing quote/bracket, then whitespace
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+
+
+def iter_sentences(chunks: Iterable[str], min_chars: int = 20) -> Iterator[str]:
+    """Re-chunk streamed LLM text into sentences as soon as each one is complete.
+    Sentences shorter than min_chars are merged with the next one so TTS is not
+    called for fragments like "Oh!".
+    """
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            cut = None
+            for m in _SENTENCE_END.finditer(buf):
+                if m.end() >= min_chars:
+                    cut = m.end()
+                    break
+            if cut is None:
+                break
+            sentence, buf = buf[:cut].strip(), buf[cut:]
+            if sentence:
+                yield sentence
+    tail = buf.strip()
+    if tail:
+        yield tail
+
+
+class SpeechPipeline:
+    """Overlap LLM generation, TTS and playback at sentence granularity.
+
+    The caller's thread drains the LLM stream and splits it into sentences; a
+    synth worker turns each sentence into a clip and a playback worker plays
+    them in order. Sentence 1 is therefore audible while sentence 2 is still
+    being generated.
+
+    synthesize(text) returns a clip (a file path or an in-memory PCM buffer)
+    and play(clip) blocks until playback ends, returning False if it was
+    interrupted. Both are injected so the pipeline runs offline with stubs.
+    Once playback is interrupted (or the optional stop event is set) the rest
+    of the reply is neither generated, synthesised nor played.
+    """
+
+    def __init__(self, synthesize: Callable[[str], Any], play: Callable[[Any], object],
+                 stop: Optional[threading.Event] = None):
+        self.synthesize = synthesize
+        self.play = play
+        self.stop = stop
+        self.first_audio_s: Optional[float] = None  # time-to-first-audio of the last run
+        self.interrupted = False  # play() returned False (barge-in) during the last run
+
+    def _halted(self) -> bool:
+        return self.interrupted or (self.stop is not None and self.stop.is_set())
+
+    def run(self, chunks: Iterable[str]) -> str:
+        """Speak the streamed reply; returns the text of the sentences that reached playback.
+
+        After an interruption that is the reply up to the sentence cut short,
+        so the caller's history holds only what the user actually heard.
+        """
+        sentences: "queue.Queue[Optional[str]]" = queue.Queue()
+        clips: "queue.Queue[Any]" = queue.Queue()
+        done = object()
+        spoken = []
+        t0 = time.perf_counter()
+        self.first_audio_s = None
+        self.interrupted = False
+
+        def synth_worker():
+            while True:
+                text = sentences.get()
+                if text is None:
+                    break
+                if self._halted():
+                    continue  # nobody will hear it
+                try:
+                    clips.put((text, self.synthesize(text)))
+                except Exception as e:
+                    print(f"[tts] {e}", file=sys.stderr)
+                    clips.put((text, None))  # still part of the reply, just not audible
+            clips.put(done)
+
+        def play_worker():
+            while True:
+                item = clips.get()
+                if item is done:
+                    break
+                if self._halted():
+                    continue
+                text, clip = item
+                spoken.append(text)
+                if clip is None:
+                    continue
+                if self.first_audio_s is None:
+                    self.first_audio_s = time.perf_counter() - t0
+                try:
+                    if self.play(clip) is False:
+                        self.interrupted = True
+                except Exception as e:
+                    print(f"[playback] {e}", file=sys.stderr)
+
+        def until_halted(stream: Iterator[str]) -> Iterator[str]:
+            for chunk in stream:
+                if self._halted():
+                    return
+                yield chunk
+
+        workers = [
+            threading.Thread(target=synth_worker, daemon=True),
+            threading.Thread(target=play_worker, daemon=True),
+        ]
+        for w in workers:
+            w.start()
+        stream = iter(chunks)
+        try:
+            for sentence in iter_sentences(until_halted(stream)):
+                if self._halted():
+                    break
+                sentences.put(sentence)
+        finally:
+            # Stop the LLM stream now rather than draining a reply nobody hears
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            sentences.put(None)
+            for w in workers:
+                w.join()
+        return " ".join(spoken)
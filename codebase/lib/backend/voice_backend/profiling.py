@@ -0,0 +1,188 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+_TORCH_LOCK = threading.Lock()
+
+
+@dataclass
+class ProfileConfig:
+    out_dir: str = "profiles"
+    sample: float = 1.0         # fraction of turns profiled
+    interval_ms: float = 5.0    # stack sampling period for the collapsed stacks
+    torch: bool = True          # torch profiler trace for the asr stage when torch is loaded
+    keep: int = 200             # newest turn directories kept; 0 = keep all
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler:
+    """Samples one thread's Python stack into collapsed-stack counts (flamegraph.pl / speedscope)."""
+
+    def __init__(self, thread_id: int, counts: Counter, interval_s: float):
+        self.thread_id = thread_id
+        self.counts = counts
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class _Turn:
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.cprofiles: Dict[str, List[cProfile.Profile]] = {}
+        self.stacks: Dict[str, Counter] = {}
+        self.torch: Dict[str, object] = {}
+
+
+class TurnProfiler:
+    """Opt-in per-turn profiling of the stages timed by metrics.METRICS.
+
+    begin_turn(timings) decides (by sampling) whether the turn keyed by that
+    timings dict is profiled; every METRICS.span(stage, timings) of a profiled
+    turn then runs under cProfile plus a stack sampler, and the asr stage also
+    under the torch profiler. end_turn() writes one directory per turn:
+    <stage>.prof (pstats), <stage>.collapsed, turn.collapsed (all stages),
+    asr.torch.json (chrome://tracing) and timings.json.
+    """
+
+    def __init__(self, cfg: Optional[ProfileConfig] = None):
+        self.cfg = cfg or ProfileConfig()
+        self._turns: Dict[int, _Turn] = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def begin_turn(self, timings: dict) -> bool:
+        if random.random() >= self.cfg.sample:
+            return False
+        with self._lock:
+            self._turns[id(timings)] = _Turn()
+        return True
+
+    @contextmanager
+    def stage(self, stage: str, timings: Optional[dict]):
+        turn = self._turns.get(id(timings)) if timings is not None else None
+        if turn is None:
+            yield
+            return
+        with turn.lock:
+            counts = turn.stacks.setdefault(stage, Counter())
+        prof: Optional[cProfile.Profile] = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # Python 3.12+: only one cProfile may be active at a time; the stack sampler still runs
+            prof = None
+        torch_prof = None
+        # The torch profiler is process-global: concurrent profiled turns skip it rather than collide
+        if stage == "asr" and self.cfg.torch and _TORCH_LOCK.acquire(blocking=False):
+            torch_prof = self._torch_profiler()
+            if torch_prof is None:
+                _TORCH_LOCK.release()
+        try:
+            with _StackSampler(threading.get_ident(), counts, self.cfg.interval_ms / 1000.0):
+                if torch_prof is not None:
+                    with torch_prof:
+                        yield
+                else:
+                    yield
+        finally:
+            if prof is not None:
+                prof.disable()
+                with turn.lock:
+                    turn.cprofiles.setdefault(stage, []).append(prof)
+            if torch_prof is not None:
+                _TORCH_LOCK.release()
+                turn.torch[stage] = torch_prof
+
+    @staticmethod
+    def _torch_profiler():
+        torch = sys.modules.get("torch")  # only when Whisper has already loaded it
+        if torch is None:
+            return None
+        try:
+            from torch.profiler import ProfilerActivity, profile
+        except ImportError:
+            return None
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        return profile(activities=activities)
+
+    def end_turn(self, timings: dict) -> Optional[str]:
+        """Write the turn's profiles; returns its directory (None if the turn was not sampled)."""
+        with self._lock:
+            turn = self._turns.pop(id(timings), None)
+            if turn is None:
+                return None
+            self._seq += 1
+            name = time.strftime("turn-%Y%m%d-%H%M%S", time.localtime(turn.started)) + f"-{os.getpid()}-{self._seq:05d}"
+        path = os.path.join(self.cfg.out_dir, name)
+        os.makedirs(path, exist_ok=True)
+        for stage, profs in turn.cprofiles.items():
+            stats = pstats.Stats(profs[0])
+            for extra in profs[1:]:
+                stats.add(extra)
+            stats.dump_stats(os.path.join(path, f"{stage}.prof"))
+        with open(os.path.join(path, "turn.collapsed"), "w", encoding="utf-8") as all_f:
+            for stage, counts in turn.stacks.items():
+                if not counts:
+                    continue
+                with open(os.path.join(path, f"{stage}.collapsed"), "w", encoding="utf-8") as f:
+                    for stack, n in counts.most_common():
+                        f.write(f"{stack} {n}\n")
+                        all_f.write(f"{stage};{stack} {n}\n")
+        for stage, prof in turn.torch.items():
+            try:
+                prof.export_chrome_trace(os.path.join(path, f"{stage}.torch.json"))
+                with open(os.path.join(path, f"{stage}.torch.txt"), "w", encoding="utf-8") as f:
+                    f.write(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=40))
+            except Exception as e:
+                print(f"torch profile not written: {e}", file=sys.stderr)
+        with open(os.path.join(path, "timings.json"), "w", encoding="utf-8") as f:
+            json.dump(timings, f, indent=2)
+        self._prune()
+        return path
+
+    def _prune(self):
+        if self.cfg.keep <= 0:
+            return
+        try:
+            dirs = sorted(d for d in os.listdir(self.cfg.out_dir) if d.startswith("turn-"))
+        except OSError:
+            return
+        for d in dirs[:-self.cfg.keep]:
+            shutil.rmtree(os.path.join(self.cfg.out_dir, d), ignore_errors=True)
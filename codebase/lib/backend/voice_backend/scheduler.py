@@ -0,0 +1,112 @@
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass
+class BatchingConfig:
+    window_ms: float = 20.0   # how long the first queued clip waits for company
+    max_batch: int = 8
+    max_queue: int = 64       # submit() blocks beyond this (backpressure)
+
+
+class ASRScheduler:
+    """Dynamic micro-batching in front of one shared Whisper model.
+
+    Callers on any thread submit clips; a single worker takes the oldest clip,
+    waits up to window_ms for more to arrive (or until max_batch), and runs the
+    group through asr.transcribe_batch(). Under light load a clip is decoded
+    almost immediately; under heavy load batches fill up and throughput grows
+    instead of every session fighting for the same cores.
+    """
+
+    def __init__(self, asr, cfg: Optional[BatchingConfig] = None):
+        self.asr = asr
+        self.cfg = cfg or BatchingConfig()
+        self._queue: "queue.Queue[Optional[Tuple[Any, Future, float]]]" = queue.Queue(self.cfg.max_queue)
+        self._lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._submitted = 0
+        self._max_depth = 0
+        self._wait_s = 0.0
+        self._busy_s = 0.0
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, audio: Any) -> "Future[str]":
+        if self._closed:
+            raise RuntimeError("ASR scheduler is closed")
+        fut: "Future[str]" = Future()
+        self._queue.put((audio, fut, time.perf_counter()))
+        with self._lock:
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+        return fut
+
+    def transcribe(self, audio: Any, timeout: Optional[float] = None) -> str:
+        return self.submit(audio).result(timeout)
+
+    def _collect(self, first) -> List[tuple]:
+        batch = [first]
+        deadline = time.perf_counter() + self.cfg.window_ms / 1000.0
+        while len(batch) < self.cfg.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # let the outer loop see the stop marker
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            t0 = time.perf_counter()
+            try:
+                texts = self.asr.transcribe_batch([audio for audio, _, _ in batch], batch_size=len(batch))
+                for (_, fut, _), text in zip(batch, texts):
+                    fut.set_result(text)
+            except Exception as e:
+                print(f"[asr-scheduler] {e}", file=sys.stderr)
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            t1 = time.perf_counter()
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._wait_s += sum(t0 - queued for _, _, queued in batch)
+                self._busy_s += t1 - t0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            items = sum(n * c for n, c in self._batch_sizes.items())
+            return {
+                "submitted": self._submitted,
+                "completed": items,
+                "batches": batches,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_depth,
+                "mean_batch_size": round(items / batches, 2) if batches else 0.0,
+                "batch_sizes": {str(n): c for n, c in sorted(self._batch_sizes.items())},
+                "mean_queue_wait_ms": round(1000 * self._wait_s / items, 1) if items else 0.0,
+                "busy_s": round(self._busy_s, 3),
+            }
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""Async HTTP/WebSocket server for many concurrent practice sessions.
+
+  POST   /sessions/{sid}/turn          WAV body (audio/*) or {"text": ...}
+                                       -> {"transcript", "reply", "timings"}
+  POST   /sessions/{sid}/reply/stream  same body; reply streamed as NDJSON lines
+                                       {"transcript"}, {"chunk"}..., {"reply"}
+  GET    /sessions/{sid}/ws            WebSocket: binary frames of 16 kHz mono int16
+                                       PCM, then {"op": "end", "speak": bool};
+                                       also {"op": "text", "text": ...}, {"op": "reset"}
+  DELETE /sessions/{sid}               drop session history
+  POST   /tts                          {"text": ...} -> audio streamed as it is synthesised
+  GET    /health, GET /stats
+  GET    /metrics                      stage latencies in Prometheus text format
+
+ASR, LLM and TTS run on a bounded thread pool; beyond max_pending in-flight
+turns new ones get 503 + Retry-After. SIGINT/SIGTERM stop accepting
+connections, close WebSockets and let running turns finish.
+
+Needs aiohttp (pip install aiohttp).
+"""
+import argparse
+import asyncio
+import io
+import json
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+import numpy as np
+
+try:
+    from .asr import MODELS, SAMPLE_RATE, read_pcm
+    from .context import ConversationContext
+    from .metrics import METRICS
+    from .pipeline import iter_sentences
+    from .single_turn import SingleTurnEngine, SingleTurnConfig
+except ImportError:
+    # Fallback for direct execution
+    from asr import MODELS, SAMPLE_RATE, read_pcm
+    from context import ConversationContext
+    from metrics import METRICS
+    from pipeline import iter_sentences
+    from single_turn import SingleTurnEngine, SingleTurnConfig
+
+
+@dataclass
+class ServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    workers: int = 4          # threads for ASR / LLM / TTS calls
+    max_pending: int = 32     # in-flight turns before answering 503
+    max_sessions: int = 256
+    max_audio_s: float = 120.0
+    grace_s: float = 30.0     # how long running turns may finish on shutdown
+
+
+class _Session:
+    def __init__(self, history: ConversationContext):
+        self.history = history
+        self.lock = asyncio.Lock()  # one turn at a time per session, in order
+
+
+class Busy(Exception):
+    pass
+
+
+class VoiceServer:
+    def __init__(self, engine: SingleTurnEngine, cfg: Optional[ServerConfig] = None):
+        self.engine = engine
+        self.cfg = cfg or ServerConfig()
+        self.pool = ThreadPoolExecutor(max_workers=self.cfg.workers, thread_name_prefix="voice")
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        # Without a batching scheduler the model must not be entered from two threads
+        self._asr_lock = threading.Lock()
+        self._sockets = set()
+        self.inflight = 0
+        self.turns = 0
+        self.rejected = 0
+        self.closing = False
+
+    def _session(self, sid: str) -> _Session:
+        sess = self.sessions.get(sid)
+        if sess is None:
+            sess = _Session(self.engine.new_history())
+            self.sessions[sid] = sess
+            while len(self.sessions) > self.cfg.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(sid)
+        return sess
+
+    # --- blocking work, run on the pool ---
+
+    def _transcribe(self, audio, timings: Optional[dict] = None) -> str:
+        if self.engine.scheduler:
+            return self.engine.transcribe(audio, timings)
+        with self._asr_lock:
+            return self.engine.transcribe(audio, timings)
+
+    def _transcribe_wav(self, data: bytes, timings: Optional[dict] = None) -> str:
+        pcm = read_pcm(io.BytesIO(data))
+        if pcm is not None:
+            return self._transcribe(pcm, timings)
+        # Not 16 kHz WAV: let ffmpeg decode/resample from a temp file
+        with tempfile.NamedTemporaryFile(suffix=".audio") as f:
+            f.write(data)
+            f.flush()
+            return self._transcribe(f.name, timings)
+
+    def _synth(self, text: str) -> bytes:
+        with METRICS.span("tts"):
+            return self.engine.voice.synthesize_bytes(text)
+
+    # --- async helpers ---
+
+    async def _call(self, fn: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def _stream(self, gen_fn: Callable[[], Iterator[str]],
+                      closed: Optional[Callable[[], bool]] = None) -> AsyncIterator[str]:
+        """Drain a blocking generator on the pool, yielding its items on the loop.
+
+        aclose() it when done: when the consumer stops early (or
+        closed() reports the client gone) the generator is closed on the pool
+        after its next item instead of running to the end.
+        """
+        loop = asyncio.get_running_loop()
+        q: asyncio.Queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def pump():
+            gen = gen_fn()
+            try:
+                for item in gen:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(q.put_nowait, item)
+            except Exception as e:
+                loop.call_soon_threadsafe(q.put_nowait, e)
+            finally:
+                gen.close()
+                loop.call_soon_threadsafe(q.put_nowait, done)
+
+        fut = loop.run_in_executor(self.pool, pump)
+        try:
+            while True:
+                item = await q.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if closed is not None and closed():
+                    return
+                yield item
+            await fut
+        finally:
+            stop.set()
+
+    def _admit(self):
+        if self.closing or self.inflight >= self.cfg.max_pending:
+            self.rejected += 1
+            raise Busy("server busy" if not self.closing else "server shutting down")
+        self.inflight += 1
+        self.turns += 1
+
+    def _release(self):
+        self.inflight -= 1
+
+    async def _read_turn(self, request):
+        """(wav bytes, text) from an audio/* or JSON request body."""
+        from aiohttp import web
+        if request.content_type.startswith("audio/") or request.content_type == "application/octet-stream":
+            limit = int(self.cfg.max_audio_s * SAMPLE_RATE * 4) + 4096
+            if request.content_length and request.content_length > limit:
+                raise web.HTTPRequestEntityTooLarge(max_size=limit, actual_size=request.content_length)
+            return await request.read(), None
+        try:
+            body = await request.json()
+            text = body["text"]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text="body must be audio/* or {\"text\": ...}")
+        return None, str(text)
+
+    # --- HTTP handlers ---
+
+    async def handle_turn(self, request):
+        from aiohttp import web
+        sid = request.match_info["sid"]
+        wav, text = await self._read_turn(request)
+        try:
+            self._admit()
+        except Busy as e:
+            return web.json_response({"error": str(e)}, status=503, headers={"Retry-After": "1"})
+        try:
+            sess = self._session(sid)
+            timings: dict = {}
+            async with sess.lock:
+                if text is None:
+                    text = await self._call(self._transcribe_wav, wav, timings)
+                reply = await self._call(self.engine.respond, text, sess.history, timings)
+            METRICS.inc("turns")
+            return web.json_response({"transcript": text, "reply": reply, "timings": timings})
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return web.json_response({"transcript": text or "", "error": str(e)}, status=500)
+        finally:
+            self._release()
+
+    async def handle_reply_stream(self, request):
+        from aiohttp import web
+        sid = request.match_info["sid"]
+        wav, text = await self._read_turn(request)
+        try:
+            self._admit()
+        except Busy as e:
+            return web.json_response({"error": str(e)}, status=503, headers={"Retry-After": "1"})
+        resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        try:
+            await resp.prepare(request)
+
+            async def send(obj):
+                await resp.write((json.dumps(obj) + "\n").encode("utf-8"))
+
+            sess = self._session(sid)
+            async with sess.lock:
+                if text is None:
+                    text = await self._call(self._transcribe_wav, wav)
+                await send({"transcript": text})
+                parts = []
+                gone = lambda: request.transport is None or request.transport.is_closing()
+                it = self._stream(lambda: self.engine.respond_stream(text, sess.history), gone)
+                try:
+                    async for chunk in it:
+                        parts.append(chunk)
+                        await send({"chunk": chunk})
+                finally:
+                    await it.aclose()
+                await send({"reply": "".join(parts).strip()})
+        except ConnectionResetError:
+            pass
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            if resp.prepared:
+                await resp.write((json.dumps({"error": str(e)}) + "\n").encode("utf-8"))
+        finally:
+            self._release()
+        await resp.write_eof()
+        return resp
+
+    async def handle_tts(self, request):
+        """Stream synthesised audio for {"text": ...} as it is produced."""
+        from aiohttp import web
+        try:
+            text = str((await request.json())["text"])
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text="body must be {\"text\": ...}")
+        try:
+            self._admit()
+        except Busy as e:
+            return web.json_response({"error": str(e)}, status=503, headers={"Retry-After": "1"})
+        fmt = self.engine.voice.format
+        resp = web.StreamResponse(headers={"Content-Type": "audio/mpeg" if fmt == "mp3" else "audio/wav"})
+        try:
+            await resp.prepare(request)
+            gone = lambda: request.transport is None or request.transport.is_closing()
+            it = self._stream(lambda: self.engine.voice.stream(text), gone)
+            try:
+                async for chunk in it:
+                    await resp.write(chunk)
+            finally:
+                await it.aclose()
+        except ConnectionResetError:
+            pass
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+        finally:
+            self._release()
+        await resp.write_eof()
+        return resp
+
+    async def handle_reset(self, request):
+        from aiohttp import web
+        self.sessions.pop(request.match_info["sid"], None)
+        return web.json_response({"ok": True})
+
+    async def handle_health(self, request):
+        from aiohttp import web
+        return web.json_response({"ok": not self.closing})
+
+    async def handle_stats(self, request):
+        from aiohttp import web
+        return web.json_response({
+            "sessions": len(self.sessions),
+            "websockets": len(self._sockets),
+            "inflight": self.inflight,
+            "turns": self.turns,
+            "rejected": self.rejected,
+            "models": MODELS.memory_report(),
+            "asr": self.engine.scheduler.stats() if self.engine.scheduler else None,
+            "llm": self.engine.llm.stats() if self.engine.llm else None,
+        })
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+        return web.Response(body=METRICS.render_prometheus().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    # --- WebSocket ---
+
+    async def _ws_turn(self, ws, sess: _Session, pcm: Optional[np.ndarray], text: Optional[str], speak: bool,
+                       gone: Callable[[], bool]):
+        async with sess.lock:
+            if text is None:
+                text = await self._call(self._transcribe, pcm)
+            # One lock for every frame of this turn: an audio header and its binary
+            # payload must not be split by a chunk message sent concurrently
+            send_lock = asyncio.Lock()
+
+            async def send_json(obj):
+                async with send_lock:
+                    await ws.send_json(obj)
+
+            await send_json({"type": "transcript", "text": text})
+            chunks: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+            parts = []
+
+            async def speaker():
+                # Synthesize sentence by sentence while the reply is still streaming
+                buf = ""
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is not None:
+                        buf += chunk
+                    sentences = list(iter_sentences([buf]))
+                    if chunk is not None:
+                        if len(sentences) < 2:
+                            continue
+                        # the last piece may still be growing; keep it raw
+                        buf = buf[buf.rfind(sentences[-1]):]
+                        sentences = sentences[:-1]
+                    for sentence in sentences:
+                        if gone():
+                            return
+                        audio = await self._call(self._synth, sentence)
+                        async with send_lock:
+                            await ws.send_json({"type": "audio", "text": sentence, "format": self.engine.voice.format})
+                            await ws.send_bytes(audio)
+                    if chunk is None:
+                        break
+
+            task = asyncio.create_task(speaker()) if speak else None
+            it = self._stream(lambda: self.engine.respond_stream(text, sess.history), gone)
+            try:
+                async for chunk in it:
+                    parts.append(chunk)
+                    await send_json({"type": "chunk", "text": chunk})
+                    if task:
+                        chunks.put_nowait(chunk)
+            finally:
+                await it.aclose()
+                if task:
+                    chunks.put_nowait(None)
+                    await task
+            await send_json({"type": "reply", "text": "".join(parts).strip()})
+
+    async def handle_ws(self, request):
+        from aiohttp import WSMsgType, web
+        sid = request.match_info["sid"]
+        ws = web.WebSocketResponse(heartbeat=30, max_msg_size=1 << 20)
+        await ws.prepare(request)
+        self._sockets.add(ws)
+        # ws.closed only flips once the read loop sees the close frame; the transport notices a dropped client
+        gone = lambda: ws.closed or request.transport is None or request.transport.is_closing()
+        sess = self._session(sid)
+        max_bytes = int(self.cfg.max_audio_s * SAMPLE_RATE * 2)
+        audio = bytearray()
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.BINARY:
+                    if len(audio) + len(msg.data) > max_bytes:
+                        audio.clear()
+                        await ws.send_json({"type": "error", "error": "utterance too long"})
+                        continue
+                    audio.extend(msg.data)
+                    continue
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    req = json.loads(msg.data)
+                    op = req.get("op")
+                except (ValueError, AttributeError):
+                    await ws.send_json({"type": "error", "error": "bad request"})
+                    continue
+                if op == "reset":
+                    sess.history.clear()
+                    audio.clear()
+                    await ws.send_json({"type": "ok"})
+                    continue
+                if op not in ("end", "text"):
+                    await ws.send_json({"type": "error", "error": f"unknown op: {op}"})
+                    continue
+                pcm = None
+                text = None
+                if op == "text":
+                    text = str(req.get("text", ""))
+                else:
+                    pcm = np.frombuffer(bytes(audio[:len(audio) // 2 * 2]), dtype=np.int16)
+                    audio.clear()
+                try:
+                    self._admit()
+                except Busy as e:
+                    await ws.send_json({"type": "error", "error": str(e), "retry_after": 1})
+                    continue
+                try:
+                    await self._ws_turn(ws, sess, pcm, text, bool(req.get("speak")), gone)
+                except Exception as e:
+                    print(f"Error: {e}", file=sys.stderr)
+                    await ws.send_json({"type": "error", "error": str(e)})
+                finally:
+                    self._release()
+        finally:
+            self._sockets.discard(ws)
+        return ws
+
+    # --- app lifecycle ---
+
+    async def _on_shutdown(self, app):
+        from aiohttp import WSCloseCode
+        self.closing = True
+        for ws in list(self._sockets):
+            await ws.close(code=WSCloseCode.GOING_AWAY, message=b"server shutdown")
+
+    async def _on_cleanup(self, app):
+        self.pool.shutdown(wait=True)
+        if self.engine.scheduler:
+            self.engine.scheduler.close()
+
+    def app(self):
+        from aiohttp import web
+        app = web.Application(client_max_size=int(self.cfg.max_audio_s * SAMPLE_RATE * 4) + 4096)
+        app.add_routes([
+            web.post("/sessions/{sid}/turn", self.handle_turn),
+            web.post("/sessions/{sid}/reply/stream", self.handle_reply_stream),
+            web.get("/sessions/{sid}/ws", self.handle_ws),
+            web.delete("/sessions/{sid}", self.handle_reset),
+            web.post("/tts", self.handle_tts),
+            web.get("/health", self.handle_health),
+            web.get("/stats", self.handle_stats),
+            web.get("/metrics", self.handle_metrics),
+        ])
+        app.on_shutdown.append(self._on_shutdown)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    def run(self):
+        from aiohttp import web
+        web.run_app(self.app(), host=self.cfg.host, port=self.cfg.port,
+                    shutdown_timeout=self.cfg.grace_s, print=None)
+
+
+def main():
+    p = argparse.ArgumentParser(description="ConversaAI HTTP/WebSocket server")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--workers', type=int, default=4, help='threads for ASR/LLM/TTS work')
+    p.add_argument('--max-pending', type=int, default=32, help='in-flight turns before 503')
+    p.add_argument('--max-sessions', type=int, default=256)
+    p.add_argument('--model', default='base')
+    p.add_argument('--language', default='en')
+    p.add_argument('--device', default='auto')
+    p.add_argument('--precision', default='auto', choices=['auto', 'fp32', 'fp16', 'int8', 'bf16'])
+    p.add_argument('--short-ctx-max-s', type=float, default=0.0)
+    p.add_argument('--cascade-from', default=None, help='try this smaller model first (e.g. tiny)')
+    p.add_argument('--cascade-budget-ms', type=float, default=1500.0)
+    p.add_argument('--batch-window-ms', type=float, default=0.0,
+                   help='micro-batch transcriptions arriving within this window (0 = off)')
+    p.add_argument('--max-batch', type=int, default=8)
+    p.add_argument('--tts-cache', default=None, help='directory for cached synthesised sentences (enables the cache)')
+    p.add_argument('--tts-cache-mb', type=int, default=64, help='TTS cache size limit in MB')
+    args = p.parse_args()
+
+    engine = SingleTurnEngine(SingleTurnConfig(
+        model_name=args.model,
+        language=args.language,
+        device=args.device,
+        precision=args.precision,
+        short_ctx_max_s=args.short_ctx_max_s,
+        cascade_from=args.cascade_from,
+        cascade_budget_ms=args.cascade_budget_ms,
+        batch_window_ms=args.batch_window_ms,
+        max_batch=args.max_batch,
+        tts_cache=args.tts_cache,
+        tts_cache_mb=args.tts_cache_mb,
+        tts_warmup=True,
+    ))
+    server = VoiceServer(engine, ServerConfig(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_pending=args.max_pending,
+        max_sessions=args.max_sessions,
+    ))
+    print(f"Voice server listening on http://{args.host}:{args.port}", file=sys.stderr)
+    server.run()
+
+
+if __name__ == '__main__':
+    main()
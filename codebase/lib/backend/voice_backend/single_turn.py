@@ -1,19 +1,26 @@
 # Single-turn engine for Flutter integration
 import os
 import sys
+import threading
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterator, List, Optional
 
 try:
-    from .asr import ASRConfig, WhisperASR
-    from .llm import GeminiResponder, GeminiConfig
-    from .nlp import simple_feedback
+    from .asr import ASRConfig, CascadeASR, CascadeConfig, WhisperASR, AudioInput, read_pcm
+    from .context import ContextConfig, ConversationContext
+    from .llm import GeminiResponder, GeminiConfig, ResilienceConfig, ResilientResponder
+    from .metrics import METRICS
+    from .nlp import simple_feedback, STOCK_PHRASES
+    from .scheduler import ASRScheduler, BatchingConfig
     from .tts import GTTSVoice, TTSConfig
 except ImportError:
     # Fallback for direct execution
-    from asr import ASRConfig, WhisperASR
-    from llm import GeminiResponder, GeminiConfig
-    from nlp import simple_feedback
+    from asr import ASRConfig, CascadeASR, CascadeConfig, WhisperASR, AudioInput, read_pcm
+    from context import ContextConfig, ConversationContext
+    from llm import GeminiResponder, GeminiConfig, ResilienceConfig, ResilientResponder
+    from metrics import METRICS
+    from nlp import simple_feedback, STOCK_PHRASES
+    from scheduler import ASRScheduler, BatchingConfig
     from tts import GTTSVoice, TTSConfig
 
 @dataclass
@@ -21,40 +28,112 @@ class SingleTurnConfig:
     model_name: str = "base"
     language: Optional[str] = "en"
     device: str = "auto"
+    precision: str = "auto"
+    short_ctx_max_s: float = 0.0
+    cascade_from: Optional[str] = None  # e.g. 'tiny'
+    cascade_budget_ms: float = 1500.0
+    batch_window_ms: float = 0.0  # >0: micro-batch concurrent transcriptions
+    max_batch: int = 8
+    llm_deadline_s: float = 8.0
+    llm_hedge_after_s: Optional[float] = None
+    context_tokens: int = 1000
     tts_lang: str = "en"
     tts_slow: bool = False
+    tts_cache: Optional[str] = None  # directory for cached synthesised sentences
+    tts_cache_mb: int = 64
+    tts_warmup: bool = False  # pre-synthesise the stock phrases in the background (long-running processes)
 
 class SingleTurnEngine:
     def __init__(self, cfg: SingleTurnConfig):
         self.cfg = cfg
-        self.asr = WhisperASR(ASRConfig(model_name=cfg.model_name, language=cfg.language, device=cfg.device))
-        self.voice = GTTSVoice(TTSConfig(lang=cfg.tts_lang, slow=cfg.tts_slow))
-        self.history: list[dict] = []
+        self.asr = WhisperASR(ASRConfig(
+            model_name=cfg.model_name,
+            language=cfg.language,
+            device=cfg.device,
+            precision=cfg.precision,
+            short_ctx_max_s=cfg.short_ctx_max_s,
+        ))
+        if cfg.cascade_from:
+            fast = WhisperASR(ASRConfig(
+                model_name=cfg.cascade_from,
+                language=cfg.language,
+                device=cfg.device,
+                precision=cfg.precision,
+            ))
+            self.asr = CascadeASR(fast, self.asr, CascadeConfig(budget_ms=cfg.cascade_budget_ms))
+        self.scheduler: ASRScheduler | None = None
+        if cfg.batch_window_ms > 0:
+            self.scheduler = ASRScheduler(self.asr, BatchingConfig(
+                window_ms=cfg.batch_window_ms, max_batch=cfg.max_batch))
+        self.voice = GTTSVoice(TTSConfig(lang=cfg.tts_lang, slow=cfg.tts_slow,
+                                         cache_dir=cfg.tts_cache, cache_max_mb=cfg.tts_cache_mb))
+        if self.voice.cache is not None and cfg.tts_warmup:
+            threading.Thread(target=self.voice.warm, args=(STOCK_PHRASES,), daemon=True).start()
+        self.history = self.new_history()
         self.gemini: GeminiResponder | None = None
         api_key = os.getenv("GEMINI_API_KEY")
         if api_key:
             try:
-                self.gemini = GeminiResponder(GeminiConfig(api_key=api_key))
+                self.gemini = GeminiResponder(GeminiConfig(api_key=api_key, api_endpoint=os.getenv("GEMINI_API_ENDPOINT")))
                 print("Gemini responder enabled.", file=sys.stderr)
             except Exception as e:
                 print(f"Gemini disabled: {e}", file=sys.stderr)
+        self.llm: ResilientResponder | None = None
+        if self.gemini:
+            self.llm = ResilientResponder(self.gemini, ResilienceConfig(
+                deadline_s=cfg.llm_deadline_s,
+                hedge_after_s=cfg.llm_hedge_after_s,
+            ))
+
+    def new_history(self) -> ConversationContext:
+        # Token-bounded; older turns are folded into a running summary
+        return ConversationContext(ContextConfig(max_tokens=self.cfg.context_tokens))
 
-    def transcribe(self, wav_path: str) -> str:
-        return self.asr.transcribe(wav_path)
+    def transcribe(self, audio: AudioInput, timings: Optional[dict] = None) -> str:
+        # timings: optional dict that receives asr_ms (see metrics.METRICS)
+        with METRICS.span("asr", timings):
+            # Decode 16 kHz WAVs in-process; other formats still go through ffmpeg
+            if isinstance(audio, str):
+                pcm = read_pcm(audio)
+                if pcm is not None:
+                    audio = pcm
+            if self.scheduler:
+                return self.scheduler.transcribe(audio)
+            return self.asr.transcribe(audio)
 
-    def respond(self, user_text: str) -> str:
+    def respond(self, user_text: str, history: Optional[ConversationContext] = None,
+                timings: Optional[dict] = None) -> str:
+        # history: per-session turn list (daemon mode); defaults to self.history
+        if history is None:
+            history = self.history
         if not user_text.strip():
             return "I didn't catch anything. Could you repeat?"
-        reply = None
-        if self.gemini:
-            try:
-                reply = self.gemini.reply(self.history, user_text)
-            except Exception as e:
-                print(f"Gemini error: {e}", file=sys.stderr)
-                reply = None
-        if reply is None:
-            fb = simple_feedback(user_text)
-            reply = fb.reply
-        self.history.append({"role": "user", "content": user_text})
-        self.history.append({"role": "assistant", "content": reply})
+        with METRICS.span("llm", timings):
+            if self.llm:
+                # Deadline-bounded; falls back to local feedback itself
+                reply = self.llm.reply(history, user_text)
+            else:
+                reply = simple_feedback(user_text).reply
+        history.append({"role": "user", "content": user_text})
+        history.append({"role": "assistant", "content": reply})
         return reply
+
+    def respond_stream(self, user_text: str, history: Optional[ConversationContext] = None,
+                       timings: Optional[dict] = None) -> Iterator[str]:
+        """Like respond(), but yields reply fragments as Gemini streams them."""
+        if history is None:
+            history = self.history
+        if not user_text.strip():
+            yield "I didn't catch anything. Could you repeat?"
+            return
+        parts: List[str] = []
+        if self.llm:
+            # Deadline-bounded; yields local feedback itself if the stream fails early
+            for chunk in METRICS.span_iter("llm", self.llm.stream_reply(history, user_text), timings):
+                parts.append(chunk)
+                yield chunk
+        else:
+            parts.append(simple_feedback(user_text).reply)
+            yield parts[0]
+        history.append({"role": "user", "content": user_text})
+        history.append({"role": "assistant", "content": "".join(parts).strip()})
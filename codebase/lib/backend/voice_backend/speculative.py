@@ -0,0 +1,92 @@
+import re
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from .llm import ResilientResponder
+
+
+def normalize_transcript(text: str) -> str:
+    """Case/punctuation-insensitive form used to decide whether a guess still holds."""
+    return " ".join(re.sub(r"[^\w' ]+", " ", text.lower()).split())
+
+
+class SpeculativeReply:
+    """Start the LLM request before the endpointer has finished waiting out the silence.
+
+    Once the user has been quiet for pause_ms (well short of silence_ms), the
+    streaming transcriber is asked for a fresh partial and the reply to that
+    partial is requested in the background. If the user speaks again the guess
+    is cancelled; when the final transcript arrives, resolve() either returns
+    the speculative reply (same words) or cancels it and asks again.
+    """
+
+    def __init__(self, llm: ResilientResponder, history, pause_ms: int = 300):
+        self.llm = llm
+        self.history = history
+        self.pause_ms = pause_ms
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+        self._armed = False
+        self._text: Optional[str] = None
+        self._future: Optional[Future] = None
+        self.hit: Optional[bool] = None  # outcome of the last resolve(); None = nothing speculated
+
+    def on_silence(self, silent_ms: int, request_partial: Callable[[], None]):
+        """Call for every captured frame with the endpointer's trailing silence."""
+        if silent_ms >= self.pause_ms:
+            if not self._armed:
+                self._armed = True
+                request_partial()
+        elif silent_ms == 0 and self._armed:
+            # Speech resumed: the guess was premature
+            self.cancel()
+
+    def cancel(self):
+        self._armed = False
+        with self._lock:
+            self._cancel_locked()
+
+    def on_partial(self, text: str):
+        if not self._armed or not text.strip():
+            return
+        with self._lock:
+            if self._future is not None and normalize_transcript(text) == normalize_transcript(self._text):
+                return
+            self._cancel_locked()
+            self._text = text
+            self._future = self.llm.submit(self.history, text)
+            self.stats["started"] += 1
+
+    def _cancel_locked(self):
+        if self._future is not None:
+            if self._future.cancel():
+                self.stats["cancelled"] += 1
+            self._future = None
+            self._text = None
+
+    def resolve(self, final_text: str, reissue: bool = True) -> Optional[str]:
+        """The reply to final_text, reusing the speculative request when it matches.
+        On a miss the request is re-asked, or None is returned if reissue is False.
+        """
+        with self._lock:
+            future, guess = self._future, self._text
+            self._future = self._text = None
+            self._armed = False
+            self.hit = None
+            if future is not None and normalize_transcript(guess) == normalize_transcript(final_text):
+                self.stats["hit"] += 1
+                self.hit = True
+            else:
+                if future is not None:
+                    future.cancel()
+                    self.stats["miss"] += 1
+                    self.hit = False
+                future = None
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass
+        return self.llm.reply(self.history, final_text) if reissue else None
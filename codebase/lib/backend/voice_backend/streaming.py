@@ -0,0 +1,122 @@
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .asr import SAMPLE_RATE, WhisperASR
+
+
+@dataclass
+class StreamingConfig:
+    interval_s: float = 0.5      # re-decode the window this often while recording
+    min_audio_s: float = 1.0     # don't decode until this much uncommitted audio exists
+    max_window_s: float = 15.0   # force-commit older segments beyond this window
+    stable_margin_s: float = 1.0 # only commit segments ending this far before the window edge
+
+
+class StreamingTranscriber:
+    """Incremental Whisper decoding while the user is still speaking.
+
+    A background worker re-decodes the uncommitted tail of the captured audio
+    every `interval_s`. A segment is committed once two consecutive decodes
+    agree on it and it ends well before the live edge; committed audio is
+    dropped from later windows, so `finish()` only decodes the last few seconds.
+    """
+
+    def __init__(self, asr: WhisperASR, cfg: Optional[StreamingConfig] = None,
+                 on_partial: Optional[Callable[[str], None]] = None):
+        self.asr = asr
+        self.cfg = cfg or StreamingConfig()
+        self.on_partial = on_partial
+        self._chunks: List[np.ndarray] = []
+        self._audio = np.zeros((0,), dtype=np.int16)
+        self._offset = 0  # samples already covered by committed text
+        self._committed: List[str] = []
+        self._prev: List[dict] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._kick = threading.Event()  # decode now instead of at the next interval
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def feed(self, pcm16: np.ndarray):
+        """Queue captured int16 frames; cheap enough for the capture loop."""
+        with self._lock:
+            self._chunks.append(pcm16)
+
+    def _snapshot(self) -> np.ndarray:
+        with self._lock:
+            chunks, self._chunks = self._chunks, []
+        if chunks:
+            self._audio = np.concatenate([self._audio] + chunks)
+        return self._audio[self._offset:]
+
+    def _decode(self, audio: np.ndarray) -> List[dict]:
+        result = self.asr.transcribe_result(audio, condition_on_previous_text=False)
+        return [
+            {"start": float(seg["start"]), "end": float(seg["end"]), "text": seg["text"].strip()}
+            for seg in result.get("segments", [])
+            if seg.get("text", "").strip()
+        ]
+
+    def request_partial(self):
+        """Ask the worker to decode right away (even a short clip), e.g. on a pause."""
+        self._kick.set()
+
+    def _step(self, force: bool = False):
+        audio = self._snapshot()
+        window_s = audio.size / SAMPLE_RATE
+        if window_s < self.cfg.min_audio_s and not (force and audio.size):
+            return
+        segs = self._decode(audio)
+        prev_texts = [p["text"] for p in self._prev]
+        n_commit = 0
+        for i, seg in enumerate(segs[:-1]):
+            agreed = i < len(prev_texts) and prev_texts[i] == seg["text"]
+            settled = seg["end"] <= window_s - self.cfg.stable_margin_s
+            overflow = window_s > self.cfg.max_window_s
+            if (agreed and settled) or overflow:
+                n_commit = i + 1
+            else:
+                break
+        tentative = [seg["text"] for seg in segs[n_commit:]]
+        if n_commit:
+            self._committed.extend(seg["text"] for seg in segs[:n_commit])
+            self._offset += int(segs[n_commit - 1]["end"] * SAMPLE_RATE)
+            segs = []  # timestamps were relative to the old offset
+        self._prev = segs
+        if self.on_partial is not None:
+            self.on_partial(" ".join(self._committed + tentative).strip())
+
+    def _run(self):
+        while True:
+            kicked = self._kick.wait(self.cfg.interval_s)
+            self._kick.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self._step(force=kicked)
+            except Exception as e:
+                print(f"[stream-asr] {e}", file=sys.stderr)
+
+    @property
+    def committed_text(self) -> str:
+        return " ".join(self._committed).strip()
+
+    def finish(self, trim: Optional[Callable[[np.ndarray, int], np.ndarray]] = None) -> str:
+        """Stop the worker and decode whatever audio is not committed yet.
+        trim(tail, start_sample), if given, cuts silence from that tail first
+        (start_sample: where the tail begins in the fed audio).
+        """
+        self._stop.set()
+        self._kick.set()
+        self._thread.join()
+        tail = self._snapshot()
+        if trim is not None and tail.size:
+            tail = trim(tail, self._offset)
+        parts = list(self._committed)
+        if tail.size:
+            parts.extend(seg["text"] for seg in self._decode(tail))
+        return " ".join(parts).strip()
@@ -1,20 +1,328 @@
+import hashlib
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import unicodedata
 from dataclasses import dataclass
-from typing import Optional
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Tuple
 
-from gtts import gTTS
+import numpy as np
 
 
 @dataclass
 class TTSConfig:
     lang: str = "en"
     slow: bool = False
+    cache_dir: Optional[str] = None  # enable the on-disk audio cache
+    cache_max_mb: int = 64
+    backend: str = "gtts"  # 'gtts' (online, MP3 files) | 'espeak' (offline, in-memory PCM)
+    voice: Optional[str] = None  # backend-specific voice name; defaults to lang
+
+
+# Every voice streams encoded audio (`format`: 'mp3' or 'wav') into memory with
+# stream(text) -> Iterator[bytes]; synthesize_bytes, synthesize_to_fp and
+# synthesize_to_file are sinks over that stream. Voices that set `pcm = True`
+# also return (int16 mono PCM, sample_rate) from synthesize_pcm.
+TTS_BACKENDS = ("gtts", "espeak")
+
+STREAM_CHUNK = 16 * 1024
+
+
+def _write_stream(chunks: Iterable[bytes], fp: BinaryIO) -> int:
+    n = 0
+    for chunk in chunks:
+        fp.write(chunk)
+        n += len(chunk)
+    return n
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+# Same boundary as pipeline.iter_sentences, without merging short sentences
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+
+
+def split_sentences(text: str) -> list[str]:
+    """Sentences of text; the unit the audio cache stores, so fixed sentences
+    (tips, prompts) hit the cache even inside a reply that quotes the user."""
+    out = []
+    start = 0
+    for m in _SENTENCE_END.finditer(text):
+        out.append(text[start:m.end()].strip())
+        start = m.end()
+    if text[start:].strip():
+        out.append(text[start:].strip())
+    return out
+
+
+class TTSCache:
+    """Content-addressed audio cache with LRU eviction.
+
+    Entries are keyed by (normalised text, lang, slow, backend) and stored as
+    <sha256><suffix> in cache_dir. File mtime doubles as the LRU clock, so the
+    recency order survives restarts; the directory is trimmed to max_bytes
+    after every insert.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 64 * 1024 * 1024, suffix: str = ".mp3"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, text: str, lang: str, slow: bool, backend: str) -> str:
+        raw = "\0".join([backend, lang, "slow" if slow else "normal", normalize_text(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def lookup(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # mark as most recently used
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def store(self, key: str, produce: Callable[[str], object]) -> str:
+        """Call produce(tmp_path) to synthesise audio, then publish it atomically."""
+        path = self.path_for(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            produce(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self.evict()
+        return path
+
+    def get_or_create(self, key: str, produce: Callable[[str], object]) -> str:
+        return self.lookup(key) or self.store(key, produce)
+
+    def read(self, key: str) -> Optional[bytes]:
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None  # evicted in between
+
+    def put(self, key: str, data: bytes) -> str:
+        def produce(tmp: str):
+            with open(tmp, "wb") as f:
+                f.write(data)
+        return self.store(key, produce)
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                # only touch our own <sha256><suffix> entries
+                if not name.endswith(self.suffix) or len(name) != 64 + len(self.suffix):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+                total += st.st_size
+            entries.sort()
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(os.path.join(self.cache_dir, name))
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
 
 
 class GTTSVoice:
+    backend = "gtts"
+    format = "mp3"
+    pcm = False
+
     def __init__(self, cfg: TTSConfig):
         self.cfg = cfg
+        self.cache: Optional[TTSCache] = None
+        if cfg.cache_dir:
+            self.cache = TTSCache(cfg.cache_dir, max_bytes=cfg.cache_max_mb * 1024 * 1024)
+
+    def _stream_uncached(self, text: str) -> Iterator[bytes]:
+        from gtts import gTTS  # deferred: only the online voice needs it
+        # gTTS requests the text in parts; each part's MP3 is yielded as soon as it arrives
+        yield from gTTS(text=text, lang=self.cfg.lang, slow=self.cfg.slow).stream()
+
+    def stream(self, text: str) -> Iterator[bytes]:
+        """Yield MP3 bytes for text; nothing is written to disk unless the cache is on.
+        With the cache, each sentence is looked up / stored on its own (MP3 frames
+        concatenate, so the clips play back as one stream).
+        """
+        if self.cache is None:
+            yield from self._stream_uncached(text)
+            return
+        for sentence in split_sentences(text):
+            key = self.cache.key(sentence, self.cfg.lang, self.cfg.slow, self.backend)
+            data = self.cache.read(key)
+            if data is not None:
+                for i in range(0, len(data), STREAM_CHUNK):
+                    yield data[i:i + STREAM_CHUNK]
+                continue
+            parts = []
+            for chunk in self._stream_uncached(sentence):
+                parts.append(chunk)
+                yield chunk
+            self.cache.put(key, b"".join(parts))
+
+    def synthesize_bytes(self, text: str) -> bytes:
+        return b"".join(self.stream(text))
+
+    def synthesize_to_fp(self, text: str, fp: BinaryIO) -> int:
+        return _write_stream(self.stream(text), fp)
+
+    def synthesize_to_file(self, text: str, out_path: str):
+        with open(out_path, "wb") as f:
+            _write_stream(self.stream(text), f)
+        return out_path
+
+    def warm(self, phrases: Iterable[str]) -> int:
+        """Pre-synthesise phrases (sentence by sentence) into the cache; returns how many were new."""
+        if self.cache is None:
+            return 0
+        before = self.cache.misses
+        for phrase in phrases:
+            if not phrase.strip():
+                continue
+            try:
+                for _ in self.stream(phrase):
+                    pass
+            except Exception as e:
+                print(f"[tts] warm-up failed for {phrase!r}: {e}", file=sys.stderr)
+        return self.cache.misses - before
+
+
+def _parse_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """Decode 16-bit PCM WAV bytes, tolerating the unset sizes streamed WAVs carry."""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise RuntimeError("not a WAV stream")
+    pos = 12
+    sr, channels = 0, 1
+    while pos + 8 <= len(data):
+        cid, size = data[pos:pos + 4], struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if cid == b"fmt ":
+            channels, sr = struct.unpack("<HI", data[body + 2:body + 8])
+        elif cid == b"data":
+            end = len(data) if size in (0, 0xFFFFFFFF) or body + size > len(data) else body + size
+            raw = data[body:end]
+            pcm = np.frombuffer(raw[:len(raw) - len(raw) % 2], dtype="<i2")
+            if channels > 1:
+                pcm = pcm[:len(pcm) - len(pcm) % channels].reshape(-1, channels)[:, 0]
+            return pcm.astype(np.int16), sr
+        pos = body + size + (size & 1)
+    raise RuntimeError("WAV stream has no data chunk")
+
+
+class EspeakVoice:
+    """Offline voice using the espeak-ng engine.
+    Audio comes back over a pipe and is decoded in memory; nothing touches disk
+    and no MP3 encode/decode happens.
+    """
+
+    backend = "espeak"
+    format = "wav"
+    pcm = True
+
+    def __init__(self, cfg: TTSConfig, executable: Optional[str] = None):
+        self.cfg = cfg
+        self.cache = None
+        self.executable = executable or shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.executable:
+            raise RuntimeError(
+                "espeak-ng not found. Install it (e.g., 'sudo apt-get install espeak-ng') to use the offline voice."
+            )
+
+    def _command(self):
+        wpm = "120" if self.cfg.slow else "165"
+        return [self.executable, "--stdout", "-v", self.cfg.voice or self.cfg.lang, "-s", wpm]
+
+    def stream(self, text: str) -> Iterator[bytes]:
+        """Yield WAV bytes as espeak produces them (the header carries no final size)."""
+        proc = subprocess.Popen(self._command(), stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        finished = False
+        try:
+            proc.stdin.write(text.encode("utf-8"))
+            proc.stdin.close()
+            while True:
+                chunk = proc.stdout.read1(STREAM_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                proc.kill()  # consumer stopped early
+            proc.stdout.close()
+            err = proc.stderr.read()
+            proc.stderr.close()
+            code = proc.wait()
+        if code != 0:
+            raise RuntimeError(f"espeak failed: {err.decode('utf-8', 'replace').strip()}")
+
+    def synthesize_bytes(self, text: str) -> bytes:
+        return b"".join(self.stream(text))
+
+    def synthesize_to_fp(self, text: str, fp: BinaryIO) -> int:
+        return _write_stream(self.stream(text), fp)
+
+    def synthesize_pcm(self, text: str) -> Tuple[np.ndarray, int]:
+        proc = subprocess.run(
+            self._command(),
+            input=text.encode("utf-8"),
+            capture_output=True,
+            check=False,
+        )
+        if proc.returncode != 0 or not proc.stdout:
+            raise RuntimeError(f"espeak failed: {proc.stderr.decode('utf-8', 'replace').strip()}")
+        return _parse_wav(proc.stdout)
 
     def synthesize_to_file(self, text: str, out_path: str):
-        tts = gTTS(text=text, lang=self.cfg.lang, slow=self.cfg.slow)
-        tts.save(out_path)
+        import soundfile as sf
+        pcm, sr = self.synthesize_pcm(text)
+        sf.write(out_path, pcm, sr, subtype='PCM_16')
         return out_path
+
+    def warm(self, phrases: Iterable[str]) -> int:
+        return 0
+
+
+def make_voice(cfg: TTSConfig):
+    """Build the voice selected by cfg.backend."""
+    backend = (cfg.backend or "gtts").lower()
+    if backend == "gtts":
+        return GTTSVoice(cfg)
+    if backend == "espeak":
+        return EspeakVoice(cfg)
+    raise ValueError(f"unknown TTS backend '{cfg.backend}' (choose from {', '.join(TTS_BACKENDS)})")